@@ -181,6 +181,12 @@ def prepare_file(
     neuron_ids = np.arange(0, num_n, dtype=int)
     h5f["ana.neuron_ids"] = neuron_ids
 
+    # newer simulations store spikes as ragged rows, they are not padded at all.
+    if "data.spiketimes_indptr" in h5f.keypaths():
+        h5f["data.spiketimes"] = _spikes_csr_to_spikes_2d(
+            h5f["data.spiketimes_indptr"][:], h5f["data.spiketimes_values"][:]
+        )
+
     # make sure that the 2d_spikes representation is nan-padded, requires loading!
     spikes = h5f["data.spiketimes"][:]
     if spikes is None:
@@ -291,8 +297,13 @@ def load_experimental_files(path_prefix, condition="1_pre_"):
     # Load spike times
     # in this format, we have a 50 ms timestep, the column is the neuron id
     # and the row is whether a neuron fired in this time step.
-    spikes_as_sparse = np.loadtxt(
-        f"{path_prefix}{condition}/Raster.csv", delimiter=",", skiprows=0
+    # pandas' c parser is much faster than np.loadtxt for these large files.
+    # empty cells become nan, which would count as a spike when comparing `!= 0`
+    spikes_as_sparse = (
+        pd.read_csv(f"{path_prefix}{condition}/Raster.csv", header=None)
+        .fillna(0)
+        .to_numpy()
+        != 0
     )
 
     # ROIs as neuron centers
@@ -344,14 +355,13 @@ def load_experimental_files(path_prefix, condition="1_pre_"):
 
     try:
         # fluorescence traces
-        fl_traces = np.loadtxt(
-            f"{path_prefix}{condition}/Results.csv", delimiter=",", skiprows=1
-        )
-
         # for each neuron, we have 4 columns, and want to use the 2nd one, "mean"
         # first col is time index, then we start counting neurons
+        # only parse the columns we need, first row is the header.
         fl_idx = np.arange(0, num_n, dtype="int") * 4 + 2
-        fl_traces = fl_traces[:, fl_idx]
+        fl_traces = pd.read_csv(
+            f"{path_prefix}{condition}/Results.csv", header=0, usecols=fl_idx
+        ).to_numpy(dtype=float)
 
         # drop first 60 seconds due to artifacts at the beginning of the recording
         fl_traces = fl_traces[1200:, :]
@@ -373,6 +383,25 @@ def load_experimental_files(path_prefix, condition="1_pre_"):
     return h5f
 
 
+def load_spiketimes(file_path):
+    """
+    Load the spiketimes of a simulation file as 2d array, first dim neurons,
+    second dim spiketimes.
+
+    Simulations store spiketimes as ragged rows, in compressed sparse row format
+    (`data.spiketimes_indptr` and `data.spiketimes_values`) and do not contain the
+    2d `data.spiketimes` anymore. This converts them to the nan-padded 2d array.
+    Older files are returned as stored (zero-padded, see `prepare_file`).
+    Use this instead of loading `/data/spiketimes` directly.
+    """
+    with h5py.File(file_path, "r") as file:
+        if "data/spiketimes_indptr" in file:
+            return _spikes_csr_to_spikes_2d(
+                file["data/spiketimes_indptr"][:], file["data/spiketimes_values"][:]
+            )
+        return file["data/spiketimes"][:]
+
+
 def prepare_minimal(spikes):
     """
     Wrapper to create the bare minimum of needed attributes from an array of spiketimes.
@@ -1965,6 +1994,35 @@ def _spikes_as_list_to_spikes_2d(spikes_as_list, num_n=None):
     return spikes_2d
 
 
+def _spikes_csr_to_spikes_2d(indptr, values):
+    """
+    convert spiketimes in compressed sparse row format to the 2d matrix
+    representation
+
+    # Parameters
+    indptr : 1d array with shape (num_neurons + 1,)
+        spiketimes of neuron n are `values[indptr[n] : indptr[n + 1]]`
+    values : 1d array with shape (num_spikes,)
+
+    # Returns
+    spikes_nan_padded : 2d array
+        with shape (num_neurons, max_number_spikes_for_single_neuron)
+    """
+
+    indptr = np.asarray(indptr, dtype="int64")
+    counts = np.diff(indptr)
+    num_n = len(counts)
+
+    spikes_2d = np.ones(shape=(num_n, np.max(counts, initial=0))) * np.nan
+
+    # row of every spike is its neuron, the column its position in that row
+    rows = np.repeat(np.arange(num_n), counts)
+    cols = np.arange(indptr[-1]) - indptr[rows]
+    spikes_2d[rows, cols] = values
+
+    return spikes_2d
+
+
 # turns out this is faster without numba
 def _inter_spike_intervals(spikes_2d, beg_times=None, end_times=None):
     """
@@ -2244,6 +2302,62 @@ def population_rate_exact_smoothing(spiketimes, bin_size, smooth_width, length=N
     return res / spiketimes.shape[0]
 
 
+def gaussian_kde_2d(x, y, grid_x, grid_y):
+    """
+    Evaluate a 2d gaussian kernel density estimate of the points (`x`, `y`) on
+    the grid spanned by `grid_x` and `grid_y`. Same result as
+    `scipy.stats.gaussian_kde` with bandwidth by scott's rule, but the
+    grid evaluation is numba compiled. nans are dropped.
+
+    # Parameters
+    x, y : 1d arrays of the same length, the data points
+    grid_x, grid_y : 1d arrays, coordinates of the grid
+
+    # Returns
+    density : 2d array, shape (len(grid_y), len(grid_x)), as needed for `contourf`
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    mask = np.isfinite(x) & np.isfinite(y)
+    x = x[mask]
+    y = y[mask]
+    num_points = len(x)
+
+    # scott's rule, scales the data covariance
+    factor = num_points ** (-1.0 / 6.0)
+    cov = np.cov(np.vstack([x, y])) * factor**2
+    inv_cov = np.linalg.inv(cov)
+    norm = 1.0 / (num_points * 2 * np.pi * np.sqrt(np.linalg.det(cov)))
+
+    return _gaussian_kde_2d_on_grid(
+        x,
+        y,
+        np.asarray(grid_x, dtype=np.float64),
+        np.asarray(grid_y, dtype=np.float64),
+        inv_cov,
+        norm,
+    )
+
+
+# not parallel but nogil, so that callers can evaluate several kdes in threads
+@jit(nopython=True, parallel=False, nogil=True, fastmath=False, cache=True)
+def _gaussian_kde_2d_on_grid(x, y, grid_x, grid_y, inv_cov, norm):
+    density = np.zeros((len(grid_y), len(grid_x)))
+    a = inv_cov[0, 0]
+    b = inv_cov[0, 1] + inv_cov[1, 0]
+    c = inv_cov[1, 1]
+    for j in range(len(grid_y)):
+        for i in range(len(grid_x)):
+            s = 0.0
+            for k in range(len(x)):
+                dx = grid_x[i] - x[k]
+                dy = grid_y[j] - y[k]
+                s += np.exp(-0.5 * (a * dx * dx + b * dx * dy + c * dy * dy))
+            density[j, i] = s * norm
+
+    return density
+
+
 def burst_detection_pop_rate(
     rate,
     bin_size,
@@ -2660,6 +2774,7 @@ def pd_bootstrap(
     f_across_samples=np.nanmean,
     percentiles=None,
     return_samples=False,
+    rng=None,
 ):
     """
     bootstrap across all rows of a dataframe to get the mean across
@@ -2680,6 +2795,9 @@ def pd_bootstrap(
         (f_within_sample is still applied to each sample.)
     percentiles : list of floats
         the percentiles to return. default is [2.5, 50, 97.5]
+    rng : np.random.Generator or None
+        used to draw the samples. default (None) creates one that is seeded from
+        the global numpy state, so `np.random.seed()` still gives reproducible results.
 
     # Returns:
     mid : estimate across all drawn bootstrap samples (`f_across_samples` is applied over the estimates of `f_within_sample`)
@@ -2694,14 +2812,21 @@ def pd_bootstrap(
     if percentiles is None:
         percentiles = [2.5, 50, 97.5]
 
+    if rng is None:
+        rng = np.random.default_rng(np.random.randint(2**31 - 1))
+
     # drop nans, i.e. for ibis we have one nan-row at the end of every burst
     df = df.query(f"`{obs}` == `{obs}`")
 
-    resampled_estimates = []
-    for idx in range(0, num_boot):
-        sample_df = df.sample(n=sample_size, replace=True, ignore_index=True)
-
-        resampled_estimates.append(f_within_sample(sample_df[obs]))
+    # draw all samples at once, each row of `samples` is one bootstrap sample
+    values = df[obs].to_numpy()
+    idx = rng.integers(0, max(len(values), 1), size=(num_boot, sample_size))
+    samples = values[idx]
+    try:
+        resampled_estimates = f_within_sample(samples, axis=1)
+    except TypeError:
+        # custom functions that do not take an axis argument
+        resampled_estimates = np.array([f_within_sample(s) for s in samples])
 
     if return_samples:
         return resampled_estimates
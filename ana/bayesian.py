@@ -21,7 +21,7 @@ def best(y1, y2, n1=None, n2=None, **kwargs):
     # Parameters
     y1, y2 : 1d np arrays, data
     n1, n2 : str, names to use for the variables y1, y2 in the trace
-    kwargs : passed to pm.sample
+    kwargs : passed to pm.sample, see `_sample`
     """
 
     if n1 is None:
@@ -66,12 +66,8 @@ def best(y1, y2, n1=None, n2=None, **kwargs):
             "effect_size", diff_of_means / np.sqrt((std_1**2 + std_2**2) / 2)
         )
 
-        kwargs = kwargs.copy()
-        kwargs.setdefault("draws", 1000)
-        kwargs.setdefault("return_inferencedata", True)
-
         # sample
-        trace = pm.sample(**kwargs)
+        trace = _sample(**kwargs)
 
     return trace
 
@@ -82,7 +78,12 @@ def best_paired(y1, y2, **kwargs):
 
     # Parameters
     y1, y2 : 1d np arrays, data
-    kwargs : passed to pm.sample
+        or 2d arrays of shape (n_observables, n_samples). Then every row gets its own
+        (independent) parameters, but all are sampled in one go, which saves the
+        model compilation and tuning for each observable.
+        Parameters in the trace then have an extra dimension, e.g.
+        `trace.posterior["mean_of_diffs"][..., row_index]`
+    kwargs : passed to pm.sample, see `_sample`
 
     https://github.com/mikemeredith/BEST/blob/main/R/BESTmcmc.R
     https://github.com/rasmusab/bayesian_first_aid/blob/d80c0fded797cff623a5ec42fb2ad8ffbec8b441/R/bayes_t_test.R#L383
@@ -95,41 +96,85 @@ def best_paired(y1, y2, **kwargs):
 
     observed_diff = y2 - y1
 
+    # one set of parameters for each row, if 2d
+    shape = observed_diff.shape[0] if observed_diff.ndim == 2 else None
+
     with pm.Model() as model:
         # I guess here our prior is more important then when unpaired.
         # here, we operate on differences, so mu is the mean difference etc
         mu = pm.Normal(
             f"mean_of_diffs",
-            mu=np.mean(observed_diff),
-            sigma=2 * np.fmax(np.std(observed_diff), 1e-5),
+            mu=np.mean(observed_diff, axis=-1),
+            sigma=2 * np.fmax(np.std(observed_diff, axis=-1), 1e-5),
+            shape=shape,
         )
         # std = pm.Uniform(f"std_of_diffs", lower=0.01, upper=10)
-        std = pm.HalfCauchy(f"std_of_diffs", beta=1)
+        std = pm.HalfCauchy(f"std_of_diffs", beta=1, shape=shape)
 
         # we assume both data to share the normality parameter, and want nu >= 1
         # JEP 2013 paper: “This prior was selected because it balances nearly normal
         # distributions (ν > 30) with heavy tailed distributions (ν < 30)”
-        nu = pm.Exponential("nu_minus_one", 1 / 29.0) + 1
+        nu = pm.Exponential("nu_minus_one", 1 / 29.0, shape=shape) + 1
 
         # convert std to precision for pymcs student t
         lam = std**-2
 
         # Likelihood (sampling distribution) of observations
-        diffs = pm.StudentT("diffs", nu=nu, mu=mu, lam=lam, observed=observed_diff)
+        if shape is None:
+            diffs = pm.StudentT("diffs", nu=nu, mu=mu, lam=lam, observed=observed_diff)
+        else:
+            # broadcast parameters along the samples of each row
+            diffs = pm.StudentT(
+                "diffs",
+                nu=nu[:, None],
+                mu=mu[:, None],
+                lam=lam[:, None],
+                observed=observed_diff,
+            )
 
         # observables
         effect_size = pm.Deterministic("effect_size", (mu - mu_ref) / std)
 
-        kwargs = kwargs.copy()
-        kwargs.setdefault("draws", 1000)
-        kwargs.setdefault("return_inferencedata", True)
-
         # sample
-        trace = pm.sample(**kwargs)
+        trace = _sample(**kwargs)
 
     return trace
 
 
+def _sample(method="nuts", num_fit=20000, **kwargs):
+    """
+    Sample the posterior of the model in the current context.
+
+    # Parameters
+    method : str, "nuts" (default) uses pm.sample. "advi" fits a mean-field
+        approximation with variational inference and draws from that instead.
+        Much faster, but only an approximation of the posterior. Good enough
+        for exploratory tables, use nuts for the final numbers.
+    num_fit : int, iterations for the advi fit. ignored for nuts.
+    kwargs : passed to pm.sample. for advi, only `draws`, `progressbar` and
+        `random_seed` are used.
+    """
+
+    kwargs = kwargs.copy()
+    kwargs.setdefault("draws", 1000)
+    kwargs.setdefault("return_inferencedata", True)
+
+    if method == "nuts":
+        return pm.sample(**kwargs)
+    elif method == "advi":
+        approx = pm.fit(
+            n=num_fit,
+            method="advi",
+            progressbar=kwargs.get("progressbar", True),
+            random_seed=kwargs.get("random_seed", None),
+        )
+        return approx.sample(
+            kwargs["draws"], return_inferencedata=kwargs["return_inferencedata"]
+        )
+    else:
+        raise ValueError(f"Unknown sampling method {method}, use 'nuts' or 'advi'")
+
+
 def probability_of_direction(
     posterior_samples, ref_func=np.greater, ref_val=0, pretty_print=False
 ):
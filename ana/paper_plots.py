@@ -36,6 +36,7 @@ import numbers
 import logging
 import warnings
 import functools
+import hashlib
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
@@ -45,6 +46,7 @@ import xarray as xr
 import palettable
 from tqdm.auto import tqdm
 from scipy import stats
+from concurrent.futures import ThreadPoolExecutor
 from benedict import benedict
 
 # our tools
@@ -5021,10 +5023,7 @@ def sim_out_degrees(
     def _plot(key, **kwargs):
         # reconstruct series of observations from histogram
         hist = ndims[key].sum(dim="repetition").to_numpy()
-        series = []
-        for idx in range(0, len(hist)):
-            y = hist[idx]
-            series.extend([x[idx]] * int(y))
+        series = np.repeat(x, hist.astype(int))
 
         # print(series)
 
@@ -5076,24 +5075,28 @@ def sim_degrees_sampled(k_inter=5, num_reps=50, ax=None, **kwargs):
         k_in_external=[],
     )
 
+    # collect one array per realization, concatenate once in the end
     for rep in tqdm(range(0, num_reps), leave=False, desc="sampling topo realizations"):
         if k_inter == -1:
             tp = topo.MergedTopology(**kwargs)
         else:
             tp = topo.ModularTopology(par_k_inter=k_inter, **kwargs)
-        res["k_out"].extend(tp.k_out)
-        res["k_in_total"].extend(tp.k_in)
+        res["k_out"].append(np.asarray(tp.k_out))
+        res["k_in_total"].append(np.asarray(tp.k_in))
 
         try:
             k_int, k_ext = topo._get_in_degrees_by_internal_external(
                 tp.aij_nested, tp.neuron_module_ids
             )
-            res["k_in_internal"].extend(k_int)
-            res["k_in_external"].extend(k_ext)
+            res["k_in_internal"].append(np.asarray(k_int))
+            res["k_in_external"].append(np.asarray(k_ext))
         except:
             # merged topo
             pass
 
+    for key in res.keys():
+        res[key] = np.concatenate(res[key]) if len(res[key]) > 0 else np.array([])
+
     if ax is None:
         fig, ax = plt.subplots()
     else:
@@ -5328,13 +5331,21 @@ def meso_xr_with_errors(da, ax=None, apply_formatting=True, **kwargs):
 
 
 def meso_resource_cycle(
-    input_file, show_nullclines=False, plot_kwargs=dict(), ax=None, **kwargs
+    input_file,
+    show_nullclines=False,
+    plot_kwargs=dict(),
+    ax=None,
+    raster_dpi=300,
+    **kwargs,
 ):
     """
     Wrapper to plot a resource cycle for a single file created from the mesoscopic model
 
     kwargs are passed to mh.plot_ax_nullcline
     plot_kwargs are passed to ph.plot_resources_vs_activity
+    raster_dpi sets the figure dpi, used when saving the rasterized traces (zorder < 0).
+        Only applies if we create the figure. When passing `ax`, pass the dpi
+        when saving instead.
     """
     if isinstance(input_file, str):
         h5f = mh.prepare_file(input_file, mod_colors=default_mod_colors)
@@ -5345,7 +5356,7 @@ def meso_resource_cycle(
         h5f = input_file
 
     if ax is None:
-        _, ax = plt.subplots()
+        _, ax = plt.subplots(dpi=raster_dpi)
     ax.set_rasterization_zorder(0)
 
     plot_kwargs = plot_kwargs.copy()
@@ -5399,8 +5410,10 @@ def meso_sketch_gate_deactivation(**kwargs):
     from mesoscopic_model import probability_to_disconnect
 
     src_resources = np.arange(0.0, 1.3, 0.01)
+    # vectorized, evaluates the whole array in one call
+    prob = np.asarray(probability_to_disconnect(src_resources, **kwargs))
     fig, ax = plt.subplots()
-    ax.plot(src_resources, probability_to_disconnect(src_resources, **kwargs))
+    ax.plot(src_resources, prob)
     ax.yaxis.set_major_locator(matplotlib.ticker.MultipleLocator(0.01))
     ax.yaxis.set_minor_locator(matplotlib.ticker.MultipleLocator(0.002))
     ax.xaxis.set_major_locator(matplotlib.ticker.MultipleLocator(1))
@@ -5513,7 +5526,9 @@ def meso_activity_snapshot(
     if zoom_duration is None:
         zoom_duration = 50
 
-    if isinstance(h5f, str):
+    # only close files we opened here, a prepared h5f may still be used by the caller
+    opened_here = isinstance(h5f, str)
+    if opened_here:
         h5f = mh.prepare_file(h5f, mod_colors=default_mod_colors)
         mh.find_system_bursts_and_module_contributions2(h5f)
 
@@ -5576,8 +5591,6 @@ def meso_activity_snapshot(
         axes[a_id].set_ylim(-1, 15)
         axes[a_id].yaxis.set_major_locator(matplotlib.ticker.MultipleLocator(15))
         axes[a_id].yaxis.set_minor_locator(matplotlib.ticker.MultipleLocator(5))
-        # workaround to show negative rate
-        sns.despine(ax=axes[a_id], trim=True)
 
     # gates
     for a_id in [1, 4]:
@@ -5597,7 +5610,14 @@ def meso_activity_snapshot(
             axes[a_id].get_legend().remove()
         except:
             pass
-        sns.despine(ax=axes[a_id], bottom=True, offset=3, trim=False)
+
+        # set spines directly in one pass, instead of repeated `sns.despine` calls.
+        # only the left spines of the main column, and the time axis survive.
+        for side in ["top", "right", "bottom", "left"]:
+            axes[a_id].spines[side].set_visible(False)
+            axes[a_id].spines[side].set_position(("outward", 3))
+        if a_id in [0, 2]:
+            axes[a_id].spines["left"].set_visible(True)
 
         # keep ticks for bottom left, we might need them
         if a_id != 2:
@@ -5606,16 +5626,16 @@ def meso_activity_snapshot(
     for a_id in [3, 4, 5]:
         # cc.detick(axis=axes[a_id].yaxis)
         axes[a_id].yaxis.set_visible(False)
-        sns.despine(ax=axes[a_id], left=True, bottom=True)
+
+    # workaround to show negative rate: trim the spine to the ticks
+    axes[0].spines["left"].set_bounds(0, 15)
 
     # remove ticks of the gating plot
     axes[1].tick_params(axis="y", which="both", left=False, labelleft=False)
-    sns.despine(ax=axes[1], left=True, bottom=True)
-    sns.despine(ax=axes[0], left=False, bottom=True, trim=False)
 
     # reenable one time axis label
     ax = axes[2]
-    sns.despine(ax=ax, left=False, bottom=False, offset=3)
+    ax.spines["bottom"].set_visible(True)
     ax.xaxis.set_major_locator(matplotlib.ticker.MultipleLocator(1000))
     ax.xaxis.set_minor_locator(matplotlib.ticker.MultipleLocator(250))
 
@@ -5639,7 +5659,8 @@ def meso_activity_snapshot(
         axes[1].set_ylabel("Gate")
         axes[2].set_ylabel("Resources")
 
-    bnb.hi5.close_hot()
+    if opened_here:
+        bnb.hi5.close_hot()
 
     _set_size(axes[0], w=main_width, h=None)
 
@@ -5654,14 +5675,20 @@ def meso_explore(
     range_to_show=None,
     zoom_start=None,
     set_size=True,
+    reuse_existing=False,
     **kwargs,
 ):
     """
     Helper to explore parameters of the mesoscopic model.
     kwargs are passed to the model, see `/src/mesoscopic_model.py`.
 
-    Creates a temporary file of the run and optionally plots the snapshot and
-    resource cycles.
+    Creates a temporary file of the run (always the same path, overwritten by
+    the next run) and optionally plots the snapshot and resource cycles.
+    A hash of the model parameters is stored in the file and, if `reuse_existing`
+    is True and a seed (`rseed`) is given, the simulation is skipped when the
+    existing file has the same hash (e.g. when only changing plot arguments).
+    The hash does not cover the model code, so do not reuse files after changing
+    the model.
 
     # Example
     ```
@@ -5678,28 +5705,62 @@ def meso_explore(
     import mesoscopic_model as mm
     import tempfile
 
-    path = tempfile.gettempdir() + "/meso_test.hdf5"
-    log.debug(f"Saving temporary file to {path}")
     pars = mm.default_pars.copy()
     for key, val in kwargs.items():
         pars[key] = val
 
-    mm.simulate_and_save(
-        output_filename=path,
-        meta_data=dict(
-            coupling=pars["w0"],
-            noise=pars["ext_str"],
-            rep=0,
-            gating_mechanism=pars["gating_mechanism"],
-        ),
-        **pars,
-    )
+    pars_hash = hashlib.sha1(repr(sorted(pars.items())).encode()).hexdigest()
+    path = f"{tempfile.gettempdir()}/meso_test.hdf5"
+
+    # without a seed, every run is a new realization, nothing to reuse
+    if reuse_existing and pars["rseed"] is None:
+        log.warning("Not reusing existing files, set `rseed` to make runs reusable")
+        reuse_existing = False
+
+    existing_hash = None
+    if reuse_existing and os.path.exists(path):
+        try:
+            with h5py.File(path, "r") as file:
+                existing_hash = file["/meta/pars_hash"][()]
+            if isinstance(existing_hash, bytes):
+                existing_hash = existing_hash.decode()
+        except Exception as e:
+            log.debug(f"Could not read parameter hash of {path}: {e}")
+
+    if existing_hash == pars_hash:
+        log.debug(f"Using existing temporary file {path}")
+    else:
+        log.debug(f"Saving temporary file to {path}")
+        # write under a different name and move when complete, so that an
+        # interrupted run never leaves a file that looks reusable
+        partial_path = f"{tempfile.gettempdir()}/meso_test_{os.getpid()}.partial.hdf5"
+        try:
+            mm.simulate_and_save(
+                output_filename=partial_path,
+                meta_data=dict(
+                    coupling=pars["w0"],
+                    noise=pars["ext_str"],
+                    rep=0,
+                    gating_mechanism=pars["gating_mechanism"],
+                    pars_hash=pars_hash,
+                ),
+                **pars,
+            )
+            os.replace(partial_path, path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
 
     ret = []
 
+    # load and analyse once, both plotting helpers accept the prepared dict
+    if activity_snapshot or resource_cycle:
+        h5f = mh.prepare_file(path, mod_colors=default_mod_colors)
+        mh.find_system_bursts_and_module_contributions2(h5f)
+
     if activity_snapshot:
         fig = meso_activity_snapshot(
-            path, range_to_show=range_to_show, zoom_start=zoom_start
+            h5f, range_to_show=range_to_show, zoom_start=zoom_start
         )
         if (t := kwargs.get("simulation_time")) is not None and range_to_show is None:
             fig.axes[0].set_xlim(0, t)
@@ -5712,7 +5773,7 @@ def meso_explore(
         cycle_kwargs.setdefault("clip_on", False)
         # cycle_kwargs.setdefault("color", "black")
         ax = meso_resource_cycle(
-            path,
+            h5f,
             ax=ax,
             show_nullclines=False,
             plot_kwargs=cycle_kwargs,
@@ -5754,19 +5815,51 @@ def meso_explore(
     return ret
 
 
-def meso_stationary_points(input_range=None):
+def meso_stationary_points(
+    input_range=None, use_cache=True, combined=True, raster_dpi=300
+):
     """
     All-in-one wrapper to find stationary points for mesoscopic model.
     Runs the model and saves the figure.
 
     # Parameters
     input_range : array of floats, h values
+    use_cache : bool
+        stationary solutions are cached to disk, keyed by the sha1 of `input_range`
+        and the model parameters, so that re-running (e.g. to tweak styling)
+        skips the ode integration.
+    combined : bool
+        if True (default), draw all three projections as panels of one figure,
+        saved as `meso_stationary_points_combined.pdf`. Set to False to get
+        one pdf per projection instead.
+    raster_dpi : int
+        resolution of the rasterized scatter points (zorder < 0) in the saved pdfs
     """
 
     if input_range is None:
         input_range = np.arange(0.0, 0.35, 0.0005)
+    input_range = np.asarray(input_range)
+
+    if f"{_p_base}/../src" not in sys.path:
+        sys.path.append(f"{_p_base}/../src")
+    import mesoscopic_model as mm
 
-    rates, rsrcs = mh.get_stationary_solutions(input_range=input_range)
+    # the solutions depend on the model parameters, too
+    key = hashlib.sha1(
+        input_range.tobytes() + repr(sorted(mm.default_pars.items())).encode()
+    ).hexdigest()[:12]
+    cache_path = f"{p_sim}/meso/processed/stationary_points_{key}.npz"
+    if use_cache and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            rates, rsrcs = cached["rates"], cached["rsrcs"]
+        log.debug(f"Loaded stationary solutions from {cache_path}")
+    else:
+        rates, rsrcs = mh.get_stationary_solutions(input_range=input_range)
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            np.savez(cache_path, rates=rates, rsrcs=rsrcs)
+        except Exception as e:
+            log.debug(f"Could not cache stationary solutions: {e}")
 
     # mark these guys with a larger, colored dot (to match the matrix of flow fields)
     special_input = [0.0, 0.1, 0.2]
@@ -5818,18 +5911,28 @@ def meso_stationary_points(input_range=None):
         Input=matplotlib.ticker.MultipleLocator(0.2),
     )
 
-    for combination in [
+    combinations = [
         ("Resources", "Rate"),
         ("Input", "Rate"),
         ("Input", "Resources"),
-    ]:
+    ]
+    if combined:
+        fig, axes = plt.subplots(
+            1, len(combinations), figsize=[3 * 3.2 / 2.54, 2.2 / 2.54]
+        )
+        fig.subplots_adjust(left=0.08, right=0.98, bottom=0.25, top=0.95, wspace=0.5)
+
+    for cdx, combination in enumerate(combinations):
         x_str = combination[0]
         y_str = combination[1]
         x = str_to_data[x_str]
         y = str_to_data[y_str]
 
         kwargs = plot_kwargs.copy()
-        fig, ax = plt.subplots()
+        if combined:
+            ax = axes[cdx]
+        else:
+            fig, ax = plt.subplots()
         ax.set_rasterization_zorder(0)
         ax.scatter(x=x, y=y, **kwargs)
         ax.set_xlabel(x_str, labelpad=1.5)
@@ -5852,11 +5955,14 @@ def meso_stationary_points(input_range=None):
 
         sns.despine(ax=ax, offset=3)
 
-        cc.set_size(ax, 2.2, 1.5)
+        if not combined:
+            cc.set_size(ax, 2.2, 1.5)
+            fig.savefig(
+                f"{p_fo}/meso_stationary_points_{x_str}_{y_str}.pdf", dpi=raster_dpi
+            )
 
-        ax.get_figure().savefig(
-            f"{p_fo}/meso_stationary_points_{x_str}_{y_str}.pdf", dpi=300
-        )
+    if combined:
+        fig.savefig(f"{p_fo}/meso_stationary_points_combined.pdf", dpi=raster_dpi)
 
     return cmap, norm
 
@@ -5927,6 +6033,22 @@ def load_pd_hdf5(input_path, keys=None):
         return res
 
 
+def _load_pd_hdf5_cached(input_path, key):
+    """
+    Memoized `load_pd_hdf5` for a single key, for the tables that load the
+    same (small) frames repeatedly. Returns a copy, so callers may modify it.
+    Reloads when the file changed on disk or `remove_outlier` was toggled.
+    """
+    mtime = os.path.getmtime(input_path)
+    return _load_pd_hdf5_memo(input_path, mtime, key, remove_outlier).copy()
+
+
+@functools.lru_cache(maxsize=16)
+def _load_pd_hdf5_memo(input_path, mtime, key, outlier_removed):
+    # `mtime` and `outlier_removed` are only part of the cache key
+    return load_pd_hdf5(input_path, keys=key)
+
+
 def custom_violins(
     df,
     category,
@@ -5965,6 +6087,10 @@ def custom_violins(
         if not None, only plot data from this trial
     """
 
+    # seeded from the global state, so `np.random.seed()` in the fig_ functions
+    # keeps working
+    rng = np.random.default_rng(np.random.randint(2**31 - 1))
+
     # log.info(f'|{"":-^75}|')
     log.debug(f"{'_pooled_' if trial is None else trial} violins for {observable}")
     log.debug(f" Condition | 2.5% percentile | 50% percentile | 97.5% percentile |")
@@ -5984,7 +6110,7 @@ def custom_violins(
     # if we have a trial, we want to plot only the data from that trial
     # else we create a pool across the ensemble, below.
     if trial is not None:
-        df = df.query(f"`Trial` == '{trial}'")
+        df = _filter_df(df, "Trial", trial)
 
     # we want half violins, so hack the data and abuse seaborns "hue" and "split"
     df["fake_hue"] = 0
@@ -6036,7 +6162,7 @@ def custom_violins(
     sub_dfs = dict()
     max_points = 0
     for idx, cat in enumerate(categories):
-        df_for_cat = df.query(f"`{category}` == '{cat}'")
+        df_for_cat = _filter_df(df, category, cat)
         sub_dfs[cat] = df_for_cat
 
         # for the swarm plot, fetch max height so we could tweak number of points and size
@@ -6066,28 +6192,15 @@ def custom_violins(
         # custom error estimates
         df_for_cat = sub_dfs[cat]
         # log.debug("bootstrapping")
-        try:
-            raise KeyError
-            # we ended up not using nested bootstrapping
-            mid, error, percentiles = ah.pd_nested_bootstrap(
-                df_for_cat,
-                grouping_col="Trial",
-                obs=observable,
-                num_boot=500,
-                func=bs_estimator,
-                resample_group_col=True,
-                percentiles=[2.5, 50, 97.5],
-            )
-        except:
-            # log.warning("Nested bootstrap failed")
-            # this may also happen when category variable is not defined.
-            mid, std, percentiles = ah.pd_bootstrap(
-                df_for_cat,
-                obs=observable,
-                num_boot=500,
-                f_within_sample=bs_estimator,
-                percentiles=[2.5, 50, 97.5],
-            )
+        # we ended up not using nested bootstrapping (`ah.pd_nested_bootstrap`)
+        mid, std, percentiles = ah.pd_bootstrap(
+            df_for_cat,
+            obs=observable,
+            num_boot=500,
+            f_within_sample=bs_estimator,
+            percentiles=[2.5, 50, 97.5],
+            rng=rng,
+        )
 
         # log.debug(f"{cat}: estimator {mid:.3g}, std {std:.3g}")
 
@@ -6140,7 +6253,7 @@ def custom_violins(
     if same_points_per_swarm:
         merged_df = []
         for idx, cat in enumerate(categories):
-            sub_df = df.query(f"`{category}` == '{cat}'")
+            sub_df = _filter_df(df, category, cat)
             if not replace:
                 num_samples = np.min([num_swarm_points, len(sub_df)])
             else:
@@ -6150,6 +6263,7 @@ def custom_violins(
                     n=num_samples,
                     replace=replace,
                     ignore_index=True,
+                    random_state=rng,
                 )
             )
         merged_df = pd.concat(merged_df, ignore_index=True)
@@ -6159,7 +6273,9 @@ def custom_violins(
             num_samples = np.min([num_swarm_points, len(df)])
         else:
             num_samples = num_swarm_points
-        merged_df = df.sample(n=num_samples, replace=replace, ignore_index=True)
+        merged_df = df.sample(
+            n=num_samples, replace=replace, ignore_index=True, random_state=rng
+        )
 
     sns.swarmplot(
         x=category,
@@ -6244,11 +6360,11 @@ def custom_rij_barplot(
 
     if conditions is None:
         conditions = ["pre", "stim"]
-    df = df.query("Pairing == @pairings")
-    df = df.query("Condition == @conditions")
+    df = _filter_df(df, "Pairing", pairings)
+    df = _filter_df(df, "Condition", conditions)
 
     if stats_for not in ["pooled", "ensemble"]:
-        df = df.query("Trial == @stats_for")
+        df = _filter_df(df, "Trial", stats_for)
 
     if stats_for == "ensemble":
         # estimate the median within each trial and use that as the value for the df
@@ -6258,11 +6374,12 @@ def custom_rij_barplot(
         df = df.groupby(["Trial", "Condition", "Pairing"]).agg(d)
 
     log.debug(f"rij barplot prepared df has {len(df)} rows")
-    for p in df["Pairing"].unique():
-        log.debug(f"pairing {p}: {len(df.query('Pairing == @p'))} rows")
-        debug = df.query("Pairing == @p")
-        for c in debug["Condition"].unique():
-            log.debug(f"condition {c}: {len(debug.query('Condition == @c'))} rows")
+    if log.isEnabledFor(logging.DEBUG):
+        for p in df["Pairing"].unique():
+            debug = _filter_df(df, "Pairing", p)
+            log.debug(f"pairing {p}: {len(debug)} rows")
+            for c in debug["Condition"].unique():
+                log.debug(f"condition {c}: {len(_filter_df(debug, 'Condition', c))} rows")
 
     if ax is None:
         fig, ax = plt.subplots()
@@ -6276,58 +6393,66 @@ def custom_rij_barplot(
         except:
             palette[c] = f"C{idx}"
 
-    with matplotlib.rc_context(rc={"lines.solid_capstyle": "butt"}):
-        sns.barplot(
-            ax=ax,
-            data=df,
-            x="Pairing",
-            hue="Condition",
-            y="Correlation Coefficient",
-            order=pairings,
-            hue_order=conditions,
-            dodge=True,
-            capsize=0.15,
-            linewidth=1,
-            errwidth=1.0,
-            palette=palette,
-            errcolor=".0",
-            edgecolor=".0",
-            # these settings reflect what we do manually in `table_rij()`
-            # the bar height is given from the
-            # estimator applied on the original data, not the bootstrap estimates
-            estimator=np.nanmedian,
-            ci=95,  # 2.5 and 97.5%
-            n_boot=500,
-            seed=815,
-            zorder=2,
-        )
+    barplot_kwargs = dict(
+        ax=ax,
+        x="Pairing",
+        hue="Condition",
+        y="Correlation Coefficient",
+        order=pairings,
+        hue_order=conditions,
+        dodge=True,
+        capsize=0.15,
+        linewidth=1,
+        errwidth=1.0,
+        # these settings reflect what we do manually in `table_rij()`
+        # the bar height is given from the
+        # estimator applied on the original data, not the bootstrap estimates
+        estimator=np.nanmedian,
+        ci=95,  # 2.5 and 97.5%
+        n_boot=500,
+        seed=815,
+        zorder=2,
+    )
 
-    # so either we plot manually to tweak the styl or we alter after creation
-    # barplot creates patches and lines
-    if recolor:
-        mult = len(pairings)
-        for pdx, pairing in enumerate(pairings):
-            for cdx, condition in enumerate(conditions):
+    with matplotlib.rc_context(rc={"lines.solid_capstyle": "butt"}):
+        if not recolor:
+            sns.barplot(
+                data=df,
+                palette=palette,
+                errcolor=".0",
+                edgecolor=".0",
+                **barplot_kwargs,
+            )
+        else:
+            # colors depend on pairing and condition, but seaborns palette only
+            # maps the hue (condition). so we draw each pairing with its own colors,
+            # instead of changing the patches and lines after creation.
+            # seaborn (0.11) seeds the bootstrap of every (pairing, condition)
+            # group with `seed`, so the error bars match a single call.
+            # the other pairings get (invisible) nan bars in each call.
+            for pairing in pairings:
                 base_color = colors[f"rij_{pairing}"]
-                try:
-                    face_alpha = condition_alphas[condition]
-                except:
-                    face_alpha = cc.fade(
-                        k=cdx, n=len(conditions), start=0.8, stop=0.4, invert=True
+                pairing_palette = dict()
+                for cdx, condition in enumerate(conditions):
+                    try:
+                        face_alpha = condition_alphas[condition]
+                    except:
+                        face_alpha = cc.fade(
+                            k=cdx, n=len(conditions), start=0.8, stop=0.4, invert=True
+                        )
+                    pairing_palette[condition] = _alpha_to_solid_on_bg(
+                        base_color, face_alpha
                     )
 
-                c = ax.patches[pdx + cdx * mult]
-                c.set_edgecolor(base_color)
-                if cdx % len(conditions) == 0:
-                    c.set_facecolor(cc.alpha_to_solid_on_bg(base_color, face_alpha))
-                else:
-                    c.set_facecolor(cc.alpha_to_solid_on_bg(base_color, face_alpha))
-
-                # three lines for error bars with caps
-                for ldx in range(0, 3):
-                    c = ax.lines[3 * (pdx + cdx * mult) + ldx]
-                    c.set_color(base_color)
+                sns.barplot(
+                    data=_filter_df(df, "Pairing", pairing),
+                    palette=pairing_palette,
+                    errcolor=base_color,
+                    edgecolor=base_color,
+                    **barplot_kwargs,
+                )
 
+    if recolor:
         ax.get_legend().set_visible(False)
         ax.set_xticks([])
         ax.yaxis.set_major_locator(matplotlib.ticker.MultipleLocator(0.5))
@@ -6348,9 +6473,21 @@ def custom_rij_scatter(
     scatter=True,
     kde_levels=None,
     max_sample_size=np.inf,
+    max_kde_sample=20000,
     solid_alpha=None,
     **kwargs,
 ):
+    """
+    Scatter plot of pairwise correlation coefficients, before (x) vs after (y),
+    with kde level sets for every pairing on top.
+
+    # Parameters
+    max_sample_size : int
+        maximum number of points to scatter, for each pairing
+    max_kde_sample : int
+        maximum number of points used to fit the kde, for each pairing.
+        The scattered points are always a subset of the kde input.
+    """
 
     if ax is None:
         fig, ax = plt.subplots()
@@ -6364,13 +6501,20 @@ def custom_rij_scatter(
 
     kwargs = kwargs.copy()
 
-    query_before = f"{column} == '{x}'"
-    query_after = f"{column} == '{y}'"
+    # seeded from the global state, so `np.random.seed()` keeps working
+    rng = np.random.default_rng(np.random.randint(2**31 - 1))
+
+    # split the frame once, instead of querying it for every pairing
+    pairing_groups = dict(list(df.groupby("Pairing", sort=False)))
 
+    # first, collect the data of all pairings, so that the kdes can share one grid
+    plot_data = dict()
     for pdx, pairing in enumerate(pairings):
 
-        df_paired = df.query(f"Pairing == '{pairing}'")
-        # print(pairing)
+        df_paired = pairing_groups.get(pairing)
+        if df_paired is None:
+            log.warning(f"no rows for pairing '{pairing}'")
+            continue
 
         log.debug(f"{len(df_paired)} points in {pairing} before querying")
 
@@ -6385,24 +6529,22 @@ def custom_rij_scatter(
         # for each paring, make two long lists of rij: before stim and during stim.
         # add data from all experiments
         # rij may be np.nan if one of the neurons did not have any spikes.
-        rijs = _rij_pairs_from_trials(
-            df_paired,
-            query_before=query_before,
-            query_after=query_after,
-        )
+        rijs = _rij_pairs_from_trials(df_paired, column=column, before=x, after=y)
+
+        # look up once, used for scatter and kde
+        pairing_color = colors.get(f"rij_{pairing}", f"C{pdx}")
 
         scatter_kwargs = kwargs.copy()
-        try:
-            scatter_kwargs.setdefault("color", colors[f"rij_{pairing}"])
-        except:
-            scatter_kwargs.setdefault("color", f"C{pdx}")
+        scatter_kwargs.setdefault("color", pairing_color)
 
         if solid_alpha is not None:
-            scatter_kwargs["color"] = cc.alpha_to_solid_on_bg(
+            scatter_kwargs["color"] = _alpha_to_solid_on_bg(
                 scatter_kwargs["color"], solid_alpha
             )
 
         scatter_kwargs.setdefault("alpha", 0.2)
+        # thousands of points, draw them as one image in vector outputs
+        scatter_kwargs.setdefault("rasterized", True)
         scatter_kwargs.setdefault("label", pairing)
         scatter_kwargs.setdefault("zorder", 1)
         scatter_kwargs.setdefault("edgecolor", None)
@@ -6419,39 +6561,101 @@ def custom_rij_scatter(
             scatter_kwargs.setdefault("marker", "o")
             scatter_kwargs.setdefault("s", 0.5)
 
-        log.debug(f"{len(rijs['before'])} rij pairs")
-        if len(rijs["before"]) > max_sample_size:
-            idx = np.random.choice(
-                np.arange(len(rijs["before"])),
-                replace=False,
-                size=max_sample_size,
-            )
-            rijs["before"] = np.array(rijs["before"])[idx]
-            rijs["after"] = np.array(rijs["after"])[idx]
+        num_pairs = len(rijs["before"])
+        log.debug(f"{num_pairs} rij pairs")
+        # only draw random subsets when there are more points than requested.
+        # scatter points are always part of the kde input.
+        rijs_kde = rijs
+        idx_kde = None
+        if num_pairs > max_kde_sample:
+            # `choice` without replacement does not shuffle all `num_pairs` indices.
+            idx_kde = rng.choice(num_pairs, replace=False, size=int(max_kde_sample))
+            # order does not matter for the kde, sorted indices give a linear gather.
+            rijs_kde = {k: v[np.sort(idx_kde)] for k, v in rijs.items()}
+
+        if len(rijs_kde["before"]) > max_sample_size:
+            # keep the scatter in random order so no trial is always drawn on top.
+            if idx_kde is None:
+                idx_scatter = rng.choice(
+                    num_pairs, replace=False, size=int(max_sample_size)
+                )
+            else:
+                # already a random draw, take its first entries
+                idx_scatter = idx_kde[: int(max_sample_size)]
+            rijs = {k: v[idx_scatter] for k, v in rijs.items()}
+
+        plot_data[pairing] = dict(
+            color=pairing_color,
+            scatter_kwargs=scatter_kwargs,
+            rijs=rijs,
+            rijs_kde=rijs_kde,
+        )
+
+    if kde_levels is None:
+        # kde_levels = [0.5, 0.9, 0.95, 0.975]
+        kde_levels = [0.75, 0.9, 0.95, 0.975]
+        # kde_levels = [0.66, 0.95]
+
+    # one grid, covering the union of all pairings, so contours are comparable
+    try:
+        grid_x, grid_y = _kde_grid(
+            [data["rijs_kde"]["before"] for data in plot_data.values()],
+            [data["rijs_kde"]["after"] for data in plot_data.values()],
+        )
+    except Exception as e:
+        log.warning(f"no kde grid: {e}")
+        grid_x, grid_y = None, None
+
+    # the kde kernel releases the gil, evaluate all pairings concurrently
+    kde_futures = dict()
+    if grid_x is not None and len(plot_data) > 0:
+        with ThreadPoolExecutor(max_workers=len(plot_data)) as executor:
+            for pairing, data in plot_data.items():
+                kde_futures[pairing] = executor.submit(
+                    _kde_on_grid,
+                    data["rijs_kde"]["before"],
+                    data["rijs_kde"]["after"],
+                    grid_x,
+                    grid_y,
+                )
+
+    for pairing, data in plot_data.items():
+        pairing_color = data["color"]
 
         if scatter:
             ax.scatter(
-                rijs["before"],
-                rijs["after"],
-                **scatter_kwargs,
+                data["rijs"]["before"],
+                data["rijs"]["after"],
+                **data["scatter_kwargs"],
                 # clip_on=False
             )
 
-        if kde_levels is None:
-            # kde_levels = [0.5, 0.9, 0.95, 0.975]
-            kde_levels = [0.75, 0.9, 0.95, 0.975]
-            # kde_levels = [0.66, 0.95]
-        for low_l in kde_levels:
-            sns.kdeplot(
-                x=rijs["before"],
-                y=rijs["after"],
-                levels=[low_l, 1],
-                fill=True,
+        if pairing not in kde_futures:
+            continue
+
+        # fit the kde once and draw all levels from the same density,
+        # instead of one `sns.kdeplot` (and one fit) per level.
+        try:
+            density = kde_futures[pairing].result()
+        except Exception as e:
+            log.warning(f"kde failed for {pairing}: {e}")
+            continue
+
+        # contour sets do not show up in legends, add a (empty) handle, as seaborn
+        ax.add_patch(
+            matplotlib.patches.Rectangle(
+                (0, 0), 0, 0, color=pairing_color, alpha=0.25, label=pairing
+            )
+        )
+        for thrs in _iso_proportion_levels(density, kde_levels):
+            ax.contourf(
+                grid_x,
+                grid_y,
+                density,
+                levels=[thrs, density.max()],
+                colors=[pairing_color],
                 alpha=0.25,
-                common_norm=False,
-                color=colors[f"rij_{pairing}"],
                 zorder=2,
-                label=pairing,
             )
 
     ax.plot([0, 1], [0, 1], zorder=0, ls="-", color="gray", clip_on=False, lw=1)
@@ -6472,11 +6676,12 @@ def custom_rij_scatter(
 def custom_tinker():
 
     for layout in ["1b", "3b", "merged"]:
-        dfs = load_pd_hdf5(
+        path = (
             "/Users/paul/Library/Mobile"
-            f" Documents/com~apple~CloudDocs/para/2_Projects/modular_cultures/_repo/_latest/dat.nosync/experiments/processed_mod_rij/{layout}.hdf5",
-            keys=["mod_rij", "mod_rij_paired"],
+            f" Documents/com~apple~CloudDocs/para/2_Projects/modular_cultures/_repo/_latest/dat.nosync/experiments/processed_mod_rij/{layout}.hdf5"
         )
+        # load each table only right before it is needed
+        df_mod_rij = load_pd_hdf5(path, keys="mod_rij")
         fig, ax = plt.subplots()
         # sns.boxplot(
         #     data=df,
@@ -6489,7 +6694,7 @@ def custom_tinker():
         # ax.set_title(layout)
 
         ax = custom_violins(
-            dfs["mod_rij"],
+            df_mod_rij,
             category="Condition",
             observable="Correlation Coefficient",
             ylim=[0, 1],
@@ -6503,14 +6708,15 @@ def custom_tinker():
         ax.set_ylim(0, 1)
         ax.set_title(layout)
 
+        df_mod_rij_paired = load_pd_hdf5(path, keys="mod_rij_paired")
         fig, ax = plt.subplots()
         custom_rij_barplot(
-            df=dfs["mod_rij_paired"], conditions=["pre", "stim", "post"], ax=ax
+            df=df_mod_rij_paired, conditions=["pre", "stim", "post"], ax=ax
         )
         ax.set_ylim(0, 1)
         ax.set_title(layout)
 
-        df_for_2d = dfs["mod_rij_paired"].query("`Condition` in ['pre', 'stim']")
+        df_for_2d = _filter_df(df_mod_rij_paired, "Condition", ["pre", "stim"])
         ax = custom_rij_scatter(
             df_for_2d,
             pairings=None,
@@ -6523,39 +6729,123 @@ def custom_tinker():
         ax.set_title(layout)
 
 
+def _filter_df(df, col, val):
+    """
+    Rows of `df` where column `col` equals `val`, or is in `val` for lists.
+    Same as `df.query("`col` == @val")` but skips the overhead of `pandas.eval`,
+    which dominates for the small frames and many calls in our plot helpers.
+    """
+    if isinstance(val, (list, tuple, np.ndarray)):
+        return df[df[col].isin(val).to_numpy()]
+    return df[df[col].to_numpy() == val]
+
+
 def _rij_pairs_from_trials(
     df_paired,
-    query_before="`Stimulation` == 'Off'",
-    query_after="`Stimulation` == 'On'",
+    column="Stimulation",
+    before="Off",
+    after="On",
 ):
     """
     For each paring, make two long lists of rij: before stim and during stim.
     add data from all experiments
     rij may be np.nan if one of the neurons did not have any spikes.
 
-    returned as a dict
+    Rows where `column == before` are matched to rows where `column == after`,
+    trial by trial, and have to appear in the same order of "Pair ID".
+
+    returned as a dict of float32 numpy arrays
     """
+    log.debug(f"querying {column} == {before} and {column} == {after}")
+
+    # trials enumerated in order of appearance, so that the concatenated result is
+    # the same as when going through `df_paired["Trial"].unique()` one by one.
+    trial_codes, _ = pd.factorize(df_paired["Trial"])
+    col_vals = df_paired[column].to_numpy()
+    pair_ids = df_paired["Pair ID"].to_numpy()
+    rij_vals = df_paired["Correlation Coefficient"].to_numpy()
+
+    idx_before = np.where(col_vals == before)[0]
+    idx_after = np.where(col_vals == after)[0]
+    # stable sort keeps the row order within each trial
+    idx_before = idx_before[np.argsort(trial_codes[idx_before], kind="stable")]
+    idx_after = idx_after[np.argsort(trial_codes[idx_after], kind="stable")]
+
+    # we make sure that on == stim and off == pre by querying df before.
+    # otherwise, we would get shape missmatch, anyway.
+    assert np.array_equal(trial_codes[idx_before], trial_codes[idx_after])
+    assert np.array_equal(pair_ids[idx_before], pair_ids[idx_after])
+
+    # only used for plotting, single precision is plenty for values in [-1, 1]
     rijs = dict()
-    rijs["before"] = []
-    rijs["after"] = []
-    log.debug(f"querying {query_before} and {query_after}")
-    for trial in df_paired["Trial"].unique():
-        df_trial = df_paired.query(f"`Trial` == '{trial}'")
-        df_before = df_trial.query(query_before)
-        df_after = df_trial.query(query_after)
-        # we make sure that on == stim and off == pre by querying df before.
-        # otherwise, we would get shape missmatch, anyway.
-        # df_before = df_trial.query(f"`Condition` == 'pre'")
-        # df_after = df_trial.query(f"`Condition` == 'stim'")
-
-        assert np.all(df_before["Pair ID"].to_numpy() == df_after["Pair ID"].to_numpy())
-
-        rijs["before"].extend(df_before["Correlation Coefficient"].to_list())
-        rijs["after"].extend(df_after["Correlation Coefficient"].to_list())
+    rijs["before"] = rij_vals[idx_before].astype(np.float32)
+    rijs["after"] = rij_vals[idx_after].astype(np.float32)
 
     return rijs
 
 
+def _kde_grid(xs, ys, gridsize=200, cut=3):
+    """
+    Grid for `_kde_on_grid` that covers the points of several data sets
+    (`xs[i]`, `ys[i]`). nans are dropped.
+
+    Like `sns.kdeplot`, the grid covers the data range plus `cut` bandwidths
+    (scott's rule, as in `ah.gaussian_kde_2d`) on each side, so that (almost) all
+    of the density is evaluated and iso-proportion levels match seaborns.
+    Here, we take the union of these ranges over all data sets.
+
+    # Returns
+    grid_x, grid_y : 1d arrays, `gridsize` points each
+    """
+    lo_x, hi_x, lo_y, hi_y = np.inf, -np.inf, np.inf, -np.inf
+    for x, y in zip(xs, ys):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        mask = np.isfinite(x) & np.isfinite(y)
+        x = x[mask]
+        y = y[mask]
+        if len(x) < 2:
+            continue
+
+        factor = len(x) ** (-1.0 / 6.0)
+        bw_x, bw_y = np.sqrt(np.diag(np.cov(np.vstack([x, y])))) * factor
+
+        lo_x = np.fmin(lo_x, x.min() - cut * bw_x)
+        hi_x = np.fmax(hi_x, x.max() + cut * bw_x)
+        lo_y = np.fmin(lo_y, y.min() - cut * bw_y)
+        hi_y = np.fmax(hi_y, y.max() + cut * bw_y)
+
+    if not np.all(np.isfinite([lo_x, hi_x, lo_y, hi_y])):
+        raise ValueError("need at least two finite points in one data set")
+
+    grid_x = np.linspace(lo_x, hi_x, gridsize)
+    grid_y = np.linspace(lo_y, hi_y, gridsize)
+    return grid_x, grid_y
+
+
+def _kde_on_grid(x, y, grid_x, grid_y):
+    """
+    Evaluate a 2d gaussian kde (bandwidth by scott's rule, as in seaborn) of the
+    points `x`, `y` on the grid spanned by `grid_x` and `grid_y`, see `_kde_grid`.
+    nans are dropped. Uses the numba version `ah.gaussian_kde_2d`.
+
+    # Returns
+    density : 2d array, shape (len(grid_y), len(grid_x))
+    """
+    return ah.gaussian_kde_2d(x, y, grid_x, grid_y)
+
+
+def _iso_proportion_levels(density, levels):
+    """
+    Convert iso-proportion levels to density thresholds, as done by `sns.kdeplot`:
+    a fraction `1 - level` of the probability mass lies above the threshold.
+    """
+    values = np.sort(density.ravel())[::-1]
+    normalized = np.cumsum(values) / values.sum()
+    idx = np.searchsorted(normalized, 1 - np.asarray(levels))
+    return np.take(values, idx, mode="clip")
+
+
 def _time_scale_bar(ax, x1, x2, y=-2, ylabel=-3, label=None, **kwargs):
 
     if label is None:
@@ -6692,8 +6982,9 @@ def _colorline(
 
     z = np.asarray(z)
 
-    points = np.array([x, y]).T.reshape(-1, 1, 2)
-    segments = np.concatenate([points[:-1], points[1:]], axis=1)
+    # segments of consecutive points, shape (N-1, 2, 2), as a view without copies
+    xy = np.column_stack([x, y])
+    segments = np.lib.stride_tricks.sliding_window_view(xy, (2, 2))[:, 0]
     lc = matplotlib.collections.LineCollection(
         segments, array=z, cmap=cmap, norm=norm, **kwargs
     )
@@ -6753,6 +7044,22 @@ def _set_size(ax, w, h=None):
         ax.figure.set_size_inches(figw, figh)
 
 
+def _alpha_to_solid_on_bg(base, alpha):
+    """
+    Memoized `cc.alpha_to_solid_on_bg`, for calls in loops over artists.
+    Colors that cannot be hashed (e.g. lists) are passed to the uncached version.
+    """
+    try:
+        return _alpha_to_solid_on_bg_cached(base, alpha)
+    except TypeError:
+        return cc.alpha_to_solid_on_bg(base, alpha)
+
+
+@functools.lru_cache(maxsize=1024)
+def _alpha_to_solid_on_bg_cached(base, alpha):
+    return cc.alpha_to_solid_on_bg(base, alpha)
+
+
 def _cmap_from_list(colors, anchors=None, n_steps=256):
     """
     create a colormap from a list of hex color strings,
@@ -6841,44 +7148,39 @@ def nhst_pairwise_for_trials(observables, layouts=None):
     if layouts is None:
         layouts = ["1b", "3b", "merged", "KCl_1b", "Bicuculline_1b"]
 
-    table = pd.DataFrame(
-        columns=["layout", "kind", "N"] + observables,
-    )
+    # collect rows as dicts, and create the table once in the end
+    rows = []
 
-    # create an appendable row for each layout
+    # create a row for each layout
     def row(layout, kind, p_dict, n=0):
         # p_dict is a dict of observable_name_as_str->scalar
-        df_dict = dict(layout=[layout], kind=[kind], N=[n])
-        for obs in p_dict.keys():
-            df_dict[obs] = [p_dict[obs]]
-        return pd.DataFrame(df_dict)
+        return dict(layout=layout, kind=kind, N=n, **p_dict)
 
     for layout in layouts:
         log.info(f"\n{layout}")
-        dfs = load_pd_hdf5(f"{p_exp}/processed/{layout}.hdf5")
-        df = dfs["trials"]
+        df = _load_pd_hdf5_cached(f"{p_exp}/processed/{layout}.hdf5", "trials")
 
         if layout in ["1b", "3b", "merged"]:
             p, n = _paired_sample_t_test(
                 df, col_vals=["pre", "stim"], alternatives="two-sided", **kwargs
             )
-            table = table.append(row(layout, "pre-stim", p, n), ignore_index=True)
+            rows.append(row(layout, "pre-stim", p, n))
 
             p, n = _paired_sample_t_test(
                 df, col_vals=["stim", "post"], alternatives="two-sided", **kwargs
             )
-            table = table.append(row(layout, "stim-post", p, n), ignore_index=True)
+            rows.append(row(layout, "stim-post", p, n))
 
             p, n = _paired_sample_t_test(
                 df, col_vals=["pre", "post"], alternatives="two-sided", **kwargs
             )
-            table = table.append(row(layout, "pre-post", p, n), ignore_index=True)
+            rows.append(row(layout, "pre-post", p, n))
 
         elif layout == "KCl_1b":
             p, n = _paired_sample_t_test(
                 df, col_vals=["KCl_0mM", "KCl_2mM"], alternatives="two-sided", **kwargs
             )
-            table = table.append(row(layout, "pre-stim", p, n), ignore_index=True)
+            rows.append(row(layout, "pre-stim", p, n))
 
         elif layout == "Bicuculline_1b":
             p, n = _paired_sample_t_test(
@@ -6887,7 +7189,9 @@ def nhst_pairwise_for_trials(observables, layouts=None):
                 alternatives="two-sided",
                 **kwargs,
             )
-            table = table.append(row(layout, "pre-stim", p, n), ignore_index=True)
+            rows.append(row(layout, "pre-stim", p, n))
+
+    table = pd.DataFrame(rows, columns=["layout", "kind", "N"] + observables)
 
     # move the number of trials to the layout description
     table["layout"] = table["layout"] + " (N=" + table["N"].map(str) + " trials)"
@@ -6999,8 +7303,10 @@ def _mann_whitney_u_test(df, col, col_vals, observables=None):
     # df = df.query(f"`{col}` == @col_vals")
 
     # we want to do a pairwise test, where a pair is before vs after in col_vals
-    before = df.query(f"`{col}` == @col_vals[0]")
-    after = df.query(f"`{col}` == @col_vals[1]")
+    # boolean masks are much cheaper than `df.query` for these small frames
+    col_data = df[col].to_numpy()
+    before = df[col_data == col_vals[0]]
+    after = df[col_data == col_vals[1]]
 
     # before and after are independant and do not need to have the same sample size
     # assert len(before) == len(after)
@@ -7013,23 +7319,32 @@ def _mann_whitney_u_test(df, col, col_vals, observables=None):
         after = after.select_dtypes(include="number")
         observables = list(before.columns)
 
-    p_values = dict()
+    # columns are observables
+    bf_all = before[observables].to_numpy(dtype=float)
+    af_all = after[observables].to_numpy(dtype=float)
+    bf_finite = np.isfinite(bf_all)
+    af_finite = np.isfinite(af_all)
+    p_vals = np.zeros(len(observables))
 
     # H0 that two related and repeated samples have identical expectation value
-    for obs in observables:
-        # filter out nans. eg. the ibi of the last/first burst
-        bf = before[obs].to_numpy()
-        bf = bf[np.where(np.isfinite(bf))]
-
-        af = after[obs].to_numpy()
-        af = af[np.where(np.isfinite(af))]
+    # observables without nans can be tested in one call along axis 0
+    complete = bf_finite.all(axis=0) & af_finite.all(axis=0)
+    if np.any(complete):
+        utest = stats.mannwhitneyu(bf_all[:, complete], af_all[:, complete], axis=0)
+        p_vals[complete] = utest.pvalue
 
+    for odx in np.where(~complete)[0]:
+        # filter out nans. eg. the ibi of the last/first burst
+        bf = bf_all[bf_finite[:, odx], odx]
+        af = af_all[af_finite[:, odx], odx]
         utest = stats.mannwhitneyu(bf, af)
-        p_values[obs] = utest.pvalue
+        p_vals[odx] = utest.pvalue
+
+    p_values = dict(zip(observables, p_vals))
 
     log.info(
-        f"mann_whitney_u_test for {col_vals}, {len(bf)} and"
-        f" {len(af)} samples, respectively. p_values:\n{_p_str(p_values)}"
+        f"mann_whitney_u_test for {col_vals}, {len(before)} and"
+        f" {len(after)} samples, respectively. p_values:\n{_p_str(p_values)}"
     )
 
     return p_values
@@ -7059,8 +7374,10 @@ def _wilcoxon_signed_rank_test(df, col, col_vals, observables=None):
     # df = df.query(f"`{col}` == @col_vals")
 
     # we want to do a pairwise test, where a pair is before vs after in col_vals
-    before = df.query(f"`{col}` == @col_vals[0]")
-    after = df.query(f"`{col}` == @col_vals[1]")
+    # boolean masks are much cheaper than `df.query` for these small frames
+    col_data = df[col].to_numpy()
+    before = df[col_data == col_vals[0]]
+    after = df[col_data == col_vals[1]]
 
     # paired observations
     assert len(before) == len(after)
@@ -7075,16 +7392,17 @@ def _wilcoxon_signed_rank_test(df, col, col_vals, observables=None):
 
     p_values = dict()
 
-    # H0 that two related and repeated samples have identical expectation value
-    for obs in observables:
-        bf = before[obs].to_numpy()
-        af = after[obs].to_numpy()
+    # columns are observables
+    bf_all = before[observables].to_numpy(dtype=float)
+    af_all = after[observables].to_numpy(dtype=float)
+    # filter out nans. correlation coefficients may become nan if no spikes
+    # were found for a neuron
+    finite = np.isfinite(bf_all) & np.isfinite(af_all)
 
-        # filter out nans. correlation coefficients may become nan if no spikes
-        # were found for a neuron
-        idx = np.where(np.isfinite(bf) & np.isfinite(af))[0]
-        bf = bf[idx]
-        af = af[idx]
+    # H0 that two related and repeated samples have identical expectation value
+    for odx, obs in enumerate(observables):
+        bf = bf_all[finite[:, odx], odx]
+        af = af_all[finite[:, odx], odx]
 
         wtest = stats.wilcoxon(bf, af)
         p_values[obs] = wtest.pvalue
@@ -7107,8 +7425,10 @@ def _kolmogorov_smirnov_test(df, col, col_vals, observables=None):
     # df = df.query(f"`{col}` == @col_vals")
 
     # we want to do a pairwise test, where a pair is before vs after in col_vals
-    before = df.query(f"`{col}` == @col_vals[0]")
-    after = df.query(f"`{col}` == @col_vals[1]")
+    # boolean masks are much cheaper than `df.query` for these small frames
+    col_data = df[col].to_numpy()
+    before = df[col_data == col_vals[0]]
+    after = df[col_data == col_vals[1]]
 
     # paired observations
     # assert len(before) == len(after)
@@ -7123,19 +7443,23 @@ def _kolmogorov_smirnov_test(df, col, col_vals, observables=None):
 
     p_values = dict()
 
-    # H0 that two related and repeated samples have identical expectation value
-    for obs in observables:
-        bf = before[obs].to_numpy()
-        af = after[obs].to_numpy()
+    # columns are observables
+    bf_all = before[observables].to_numpy(dtype=float)
+    af_all = after[observables].to_numpy(dtype=float)
+    # filter out nans. correlation coefficients may become nan if no spikes
+    # were found for a neuron. only possible if both have the same length.
+    try:
+        finite = np.isfinite(bf_all) & np.isfinite(af_all)
+    except ValueError:
+        finite = None
 
-        # filter out nans. correlation coefficients may become nan if no spikes
-        # were found for a neuron
-        try:
-            idx = np.where(np.isfinite(bf) & np.isfinite(af))[0]
-            bf = bf[idx]
-            af = af[idx]
-        except:
-            pass
+    # H0 that two related and repeated samples have identical expectation value
+    for odx, obs in enumerate(observables):
+        bf = bf_all[:, odx]
+        af = af_all[:, odx]
+        if finite is not None:
+            bf = bf[finite[:, odx]]
+            af = af[finite[:, odx]]
 
         kstest = stats.ks_2samp(data1=bf, data2=af)
         p_values[obs] = kstest.pvalue
@@ -7182,8 +7506,10 @@ def _paired_sample_t_test(
     # df = df.query(f"`{col}` == @col_vals")
 
     # we want to do a pairwise test, where a pair is before vs after in col_vals
-    before = df.query(f"`{col}` == @col_vals[0]")
-    after = df.query(f"`{col}` == @col_vals[1]")
+    # boolean masks are much cheaper than `df.query` for these small frames
+    col_data = df[col].to_numpy()
+    before = df[col_data == col_vals[0]]
+    after = df[col_data == col_vals[1]]
     assert len(before) == len(after)
     num_samples = len(before)
 
@@ -7208,22 +7534,35 @@ def _paired_sample_t_test(
     elif isinstance(alternatives, str):
         alternatives = {obs: alternatives for obs in observables}
 
-    p_values = dict()
+    # columns are observables
+    bf_all = before[observables].to_numpy(dtype=float)
+    af_all = after[observables].to_numpy(dtype=float)
+
+    # this is a lazy workaround so we do not need to specify in which direction
+    # our alternative hypothesis goes - since this will be different for
+    # any of the passed observables!
+    scipy_alts = np.array(
+        [
+            "two-sided" if alternatives[obs] == "one-sided" else alternatives[obs]
+            for obs in observables
+        ]
+    )
+    p_vals = np.zeros(len(observables))
 
     # H0 that two related and repeated samples have identical expectation value
-    for obs in observables:
-        alternative = alternatives[obs]
-        if alternative == "one-sided":
-            alternative = "two-sided"
-        ttest = stats.ttest_rel(before[obs], after[obs], alternative=alternative)
-        p = ttest.pvalue
-
-        # this is a lazy workaround so we do not need to specify in which direction
-        # our alternative hypothesis goes - since this will be different for
-        # any of the passed observables!
+    # one call along axis 0 for all observables that share the alternative
+    for alternative in np.unique(scipy_alts):
+        sel = scipy_alts == alternative
+        ttest = stats.ttest_rel(
+            bf_all[:, sel], af_all[:, sel], axis=0, alternative=alternative
+        )
+        p_vals[sel] = ttest.pvalue
+
+    p_values = dict()
+    for odx, obs in enumerate(observables):
+        p = p_vals[odx]
         if alternatives[obs] == "one-sided":
             p /= 2.0
-
         p_values[obs] = p
 
     log.info(
@@ -7272,25 +7611,45 @@ def _filter_df_for_pairwise(df, filter_col, filter_vals, pairby_col, value_col):
     ```
     """
 
-    # filter
-    df0 = df.query(f"`{filter_col}` == @filter_vals[0]")
-    df1 = df.query(f"`{filter_col}` == @filter_vals[1]")
-    assert len(df0) == len(df1), "number of samples must be the same"
-    assert len(df0) == len(df0[pairby_col].unique()), "each `pairby` must be unique"
+    return _filter_df_for_pairwise_multi(
+        df, filter_col, filter_vals, pairby_col, value_cols=[value_col]
+    )[value_col]
+
+
+def _filter_df_for_pairwise_multi(df, filter_col, filter_vals, pairby_col, value_cols):
+    """
+    Like `_filter_df_for_pairwise` but for several value columns at once.
+    The pairing does not depend on the value column, so we only filter and
+    align once.
+
+    # Returns:
+    dict of dicts, first key is the value column, second the filter value
+    (and `pairby_col`), as returned by `_filter_df_for_pairwise`.
+    """
 
-    # make sure both dataframes have the same order in terms of `pairby`
-    df1.set_index(pairby_col, inplace=True)
-    df1 = df1.reindex(df0[pairby_col])
-    df1.reset_index(inplace=True)
+    # filter once, for both values
+    sub = df.loc[
+        df[filter_col].isin(filter_vals[0:2]), [filter_col, pairby_col] + value_cols
+    ]
+    first = sub[filter_col].to_numpy() == filter_vals[0]
+    num_first = np.sum(first)
+    assert num_first == len(sub) - num_first, "number of samples must be the same"
+
+    # conditions side by side, aligned by `pairby`. pivot raises on duplicates.
+    wide = sub.pivot(index=pairby_col, columns=filter_col, values=value_cols)
+    assert len(wide) == num_first, "each `pairby` must be unique"
 
-    # lets check that worked
-    assert np.all(df0[pairby_col].values == df1[pairby_col].values)
+    # keep the order in which `pairby` appears for the first value
+    wide = wide.reindex(sub[pairby_col].to_numpy()[first])
+    pairby_vals = wide.index.to_numpy()
 
     # get the values
     res = dict()
-    res[filter_vals[0]] = df0[value_col].values
-    res[filter_vals[1]] = df1[value_col].values
-    res[pairby_col] = df1[pairby_col].values
+    for value_col in value_cols:
+        res[value_col] = dict()
+        res[value_col][filter_vals[0]] = wide[(value_col, filter_vals[0])].to_numpy()
+        res[value_col][filter_vals[1]] = wide[(value_col, filter_vals[1])].to_numpy()
+        res[value_col][pairby_col] = pairby_vals
 
     return res
 
@@ -7329,7 +7688,9 @@ def _p_str(p_values, alternatives=None):
 # ------------------------------------------------------------------------------ #
 
 
-def bayesian_best_for_trials(observables, layouts=None):
+def bayesian_best_for_trials(
+    observables, layouts=None, num_workers=None, method="nuts"
+):
     """
     Bayesian estimation supersedes the t-test.
     http://doi.apa.org/getdoi.cfm?doi=10.1037/a0029146
@@ -7338,16 +7699,23 @@ def bayesian_best_for_trials(observables, layouts=None):
     between two conditions, and the Probability of Direction (PD), see also
     https://doi.org/10.3389/fpsyg.2019.02767
 
-    Takes around ~3 minutes per observable.
+    Takes around ~3 minutes per condition pair, all observables are sampled jointly.
+    Condition pairs (and layouts) are independent and are fitted in parallel processes.
 
     # Parameters
     observables : list of strings,
         the usual candidates...
         ["Mean Fraction", "Mean Correlation", "Functional Complexity"]
+    num_workers : int or None
+        number of processes to use. Default (None) uses one process per four
+        cpu cores (pymc runs four chains per fit). Set to 1 to fit serially.
+        Chains of each fit run in parallel on the cores left per process.
+    method : str
+        "nuts" (default) or "advi". advi only approximates the posterior but
+        takes seconds instead of minutes, see `bayesian._sample`.
     """
 
-    import bayesian
-    from itertools import product
+    from concurrent.futures import ProcessPoolExecutor
 
     # lets be reproducible
     np.random.seed(42)
@@ -7358,84 +7726,59 @@ def bayesian_best_for_trials(observables, layouts=None):
     if layouts is None:
         layouts = ["1b", "3b", "merged", "KCl_1b", "Bicuculline_1b"]
 
-    table = pd.DataFrame(
-        columns=["layout", "kind", "N", "stat"] + observables,
-    )
-
-    # create an appendable row for each layout
-    def row(trial_df, layout, filter_vals, kind=None):
-        # well, actually we create three rows (2x hdi, 1x pd), but never mind.
-
-        if kind is None:
-            kind = "-".join(filter_vals)
-
-        for odx, obs in enumerate(observables):
-            # create pair-wise samples for current observable from dataframe
-            pair_dict = _filter_df_for_pairwise(
-                trial_df,
-                filter_col="Condition",
-                filter_vals=filter_vals,
-                pairby_col="Trial",
-                value_col=obs,
-            )
-            num_trials = len(pair_dict["Trial"])
-
-            # bayesian HDI for each pairwise sample
-            trace = bayesian.best_paired(
-                pair_dict[filter_vals[0]],
-                pair_dict[filter_vals[1]],
-                # kwargs are passed to pymc.sample
-                progressbar=False,
-                tune=2000,
-                draws=2000,
-            )
-            summary = bayesian.az.summary(trace)
-            # probability of direction
-            prob_d = bayesian.probability_of_direction(trace.posterior["mean_of_diffs"])
-            # relate to nhst p-value (https://en.wikipedia.org/wiki/Probability_of_direction)
-            # be agnostic about the direction of effect -> corresponds to two-side tests
-            p_val = 2 * (prob_d if prob_d < 0.5 else 1 - prob_d)
-
-            # init, trials should be consistent across all observables
-            if odx == 0:
-                stat = ["hdi_3%", "hdi_97%", "pd", "p"]
-                rows = dict(
-                    layout=[layout] * len(stat),
-                    kind=[kind] * len(stat),
-                    N=[num_trials] * len(stat),
-                    stat=stat,
-                )
-
-            rows[obs] = [
-                summary["hdi_3%"]["mean_of_diffs"],
-                summary["hdi_97%"]["mean_of_diffs"],
-                prob_d,
-                p_val,
-            ]
-
-        # return dataframe consisting of the rows
-        return pd.DataFrame(rows)
+    if num_workers is None:
+        num_workers = max(1, os.cpu_count() // 4)
 
+    # collect all fits first, each job are the arguments for `_bayesian_best_row`
+    jobs = []
     for layout in layouts:
-        dfs = load_pd_hdf5(f"{p_exp}/processed/{layout}.hdf5")
-        df = dfs["trials"]
+        df = _load_pd_hdf5_cached(f"{p_exp}/processed/{layout}.hdf5", "trials")
+        # split by condition once, every job only gets (and pickles) the two
+        # conditions it compares
+        by_cond = dict(list(df.groupby("Condition", sort=False, observed=True)))
+        pair_df = lambda vals: pd.concat([by_cond[v] for v in vals])
 
         if layout in ["1b", "3b", "merged"]:
-            table = table.append(row(df, layout, ["pre", "stim"]), ignore_index=True)
-            table = table.append(row(df, layout, ["stim", "post"]), ignore_index=True)
-            table = table.append(row(df, layout, ["pre", "post"]), ignore_index=True)
+            for vals in [["pre", "stim"], ["stim", "post"], ["pre", "post"]]:
+                jobs.append((pair_df(vals), layout, vals))
 
         elif layout == "KCl_1b":
-            table = table.append(
-                row(df, layout, ["KCl_0mM", "KCl_2mM"], kind="pre-stim"),
-                ignore_index=True,
-            )
+            vals = ["KCl_0mM", "KCl_2mM"]
+            jobs.append((pair_df(vals), layout, vals, "pre-stim"))
 
         elif layout == "Bicuculline_1b":
-            table = table.append(
-                row(df, layout, ["spon_Bic_20uM", "stim_Bic_20uM"], kind="pre-stim"),
-                ignore_index=True,
-            )
+            vals = ["spon_Bic_20uM", "stim_Bic_20uM"]
+            jobs.append((pair_df(vals), layout, vals, "pre-stim"))
+
+    # kwargs are passed to pymc.sample.
+    # chains run in parallel, split the cores among workers so we do not oversubscribe
+    num_chains = 4
+    sample_kwargs = dict(
+        progressbar=False,
+        tune=2000,
+        draws=2000,
+        chains=num_chains,
+        cores=min(num_chains, max(1, os.cpu_count() // num_workers)),
+        method=method,
+    )
+
+    if num_workers == 1:
+        rows = [
+            _bayesian_best_row(*job, observables=observables, **sample_kwargs)
+            for job in jobs
+        ]
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = [
+                executor.submit(
+                    _bayesian_best_row, *job, observables=observables, **sample_kwargs
+                )
+                for job in jobs
+            ]
+            rows = [future.result() for future in futures]
+
+    # columns are layout, kind, N, stat, and then the observables
+    table = pd.concat(rows, ignore_index=True)
 
     # move the number of trials to the layout description
     table["layout"] = table["layout"] + " (N=" + table["N"].map(str) + " trials)"
@@ -7445,3 +7788,73 @@ def bayesian_best_for_trials(observables, layouts=None):
     # table = table.set_index(["layout", "N", "kind", "stat"])
 
     return table
+
+
+def _bayesian_best_row(
+    trial_df, layout, filter_vals, kind=None, observables=None, **sample_kwargs
+):
+    """
+    Create an appendable row for `bayesian_best_for_trials`.
+    Lives on module level so it can be sent to worker processes.
+
+    well, actually we create four rows (2x hdi, pd, p), but never mind.
+
+    # Parameters
+    sample_kwargs : passed to pymc.sample
+    """
+
+    import bayesian
+
+    if kind is None:
+        kind = "-".join(filter_vals)
+
+    # create pair-wise samples for every observable from dataframe.
+    # trials are in the same order for all observables
+    all_pairs = _filter_df_for_pairwise_multi(
+        trial_df,
+        filter_col="Condition",
+        filter_vals=filter_vals,
+        pairby_col="Trial",
+        value_cols=observables,
+    )
+    pair_dicts = [all_pairs[obs] for obs in observables]
+    num_trials = len(pair_dicts[0]["Trial"])
+
+    # bayesian HDI for each pairwise sample.
+    # all observables in one model (independent parameters), so we only
+    # compile and tune once. rows are observables
+    trace = bayesian.best_paired(
+        np.vstack([pair_dict[filter_vals[0]] for pair_dict in pair_dicts]),
+        np.vstack([pair_dict[filter_vals[1]] for pair_dict in pair_dicts]),
+        **sample_kwargs,
+    )
+    # only the hdi of the mean of diffs, skip the diagnostics (ess, r_hat)
+    summary = bayesian.az.summary(
+        trace, var_names=["mean_of_diffs"], kind="stats", hdi_prob=0.94
+    )
+    mean_of_diffs = trace.posterior["mean_of_diffs"].to_numpy()
+
+    stat = ["hdi_3%", "hdi_97%", "pd", "p"]
+    var_names = [f"mean_of_diffs[{odx}]" for odx in range(len(observables))]
+
+    # rows are stats, columns are observables
+    data = np.zeros(shape=(len(stat), len(observables)))
+    data[0:2] = summary.loc[var_names, ["hdi_3%", "hdi_97%"]].to_numpy().T
+
+    # probability of direction
+    data[2] = [
+        bayesian.probability_of_direction(mean_of_diffs[..., odx])
+        for odx in range(len(observables))
+    ]
+    # relate to nhst p-value (https://en.wikipedia.org/wiki/Probability_of_direction)
+    # be agnostic about the direction of effect -> corresponds to two-side tests
+    data[3] = 2 * np.fmin(data[2], 1 - data[2])
+
+    # return dataframe consisting of the rows
+    rows = pd.DataFrame(data, columns=observables)
+    rows.insert(0, "layout", layout)
+    rows.insert(1, "kind", kind)
+    rows.insert(2, "N", num_trials)
+    rows.insert(3, "stat", stat)
+
+    return rows
@@ -50,7 +50,8 @@ arg_list = product(l_k_inter, l_jA, l_jG, l_jM, l_tD, l_rep)
 
 count_dynamic = 0
 count_topo = 0
-with open("./parameters.tsv", "w") as f_dyn:
+# large buffer, we write many short lines
+with open("./parameters.tsv", "w", buffering=1 << 20) as f_dyn:
     # set the cli arguments
     f_dyn.write("# commands to run, one line per realization\n")
 
@@ -65,30 +66,38 @@ with open("./parameters.tsv", "w") as f_dyn:
 
         seed += 1
 
+        # format everything that does not change with the rate only once
+        f_prefix = f"{out_path}/stim={mod}_k={k_inter:d}_kin={kin:02d}_jA={jA:.1f}_jG={jG:.1f}_jM={jM:.1f}_tD={tD:.1f}"
+        rep_suffix = f"_rep={rep:03d}.hdf5"
+        cmd_args = (
+            f"-kin {kin} "
+            + f"-k {k_inter} "
+            + f"-d 1800 -equil 300 -s {seed:d} "
+            + f"--bridge_weight {bridge_weight} "
+            + f"--inhibition {inh_frac} "
+            + f"-jA {jA} -jG {jG} -jM {jM} "
+        )
+
+        if mod == "off":
+            stim_arg = ""
+        else:
+            stim_arg = f"-stim hideaki -mod {mod}"
+
         # same seeds for all rates so that topo matches
+        lines = []
         for rate in l_rate:
-            f_base = f"k={k_inter:d}_kin={kin:02d}_jA={jA:.1f}_jG={jG:.1f}_jM={jM:.1f}_tD={tD:.1f}_rate={rate:.1f}_rep={rep:03d}.hdf5"
-
-            dyn_path = f"{out_path}/stim={mod}_{f_base}"
-
-            if mod == "off":
-                stim_arg = ""
-            else:
-                stim_arg = f"-stim hideaki -mod {mod}"
+            dyn_path = f"{f_prefix}_rate={rate:.1f}{rep_suffix}"
 
-            f_dyn.write(
+            lines.append(
                 # dynamic command
                 f"python ./src/quadratic_integrate_and_fire.py "
-                + f'-o {dyn_path} '
-                + f'-kin {kin} '
-                + f"-k {k_inter} "
-                + f"-d 1800 -equil 300 -s {seed:d} "
-                + f"--bridge_weight {bridge_weight} "
-                + f"--inhibition {inh_frac} "
-                + f"-jA {jA} -jG {jG} -jM {jM} -r {rate} -tD {tD} "
+                + f"-o {dyn_path} "
+                + cmd_args
+                + f"-r {rate} -tD {tD} "
                 + f"{stim_arg}\n"
             )
 
-            count_dynamic += 1
+        f_dyn.writelines(lines)
+        count_dynamic += len(lines)
 
 print(f"number of argument combinations for dynamics: {count_dynamic}")
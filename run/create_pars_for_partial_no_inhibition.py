@@ -51,7 +51,8 @@ arg_list = product(l_k_inter, l_jA, l_jG, l_jM, l_tD, l_rep)
 
 count_dynamic = 0
 count_topo = 0
-with open("./parameters.tsv", "w") as f_dyn:
+# large buffer, we write many short lines
+with open("./parameters.tsv", "w", buffering=1 << 20) as f_dyn:
     # set the cli arguments
     f_dyn.write("# commands to run, one line per realization\n")
 
@@ -66,30 +67,37 @@ with open("./parameters.tsv", "w") as f_dyn:
 
         seed += 1
 
+        # format everything that does not change with the stim rate only once
+        f_prefix = f"{out_path}/stim={mod}_k={k_inter:d}_kin={k_in:d}_jA={jA:.1f}_jG={jG:.1f}_jM={jM:.1f}_tD={tD:.1f}_rate={rate:.1f}"
+        rep_suffix = f"_rep={rep:03d}.hdf5"
+        cmd_args = (
+            f"-k {k_inter} "
+            + f"-kin {k_in} "
+            + f"-d 1800 -equil 300 -s {seed:d} "
+            + f"--bridge_weight {bridge_weight} "
+            + f"--inhibition {inh_frac} "
+            + f"-jA {jA} -jG {jG} -jM {jM} -r {rate} -tD {tD} "
+        )
+
         # same seeds for all rates so that topo matches
+        lines = []
         for stim_rate in l_stim_rate:
-            f_base = f"k={k_inter:d}_kin={k_in:d}_jA={jA:.1f}_jG={jG:.1f}_jM={jM:.1f}_tD={tD:.1f}_rate={rate:.1f}_stimrate={stim_rate:.1f}_rep={rep:03d}.hdf5"
-
-            dyn_path = f"{out_path}/stim={mod}_{f_base}"
+            dyn_path = f"{f_prefix}_stimrate={stim_rate:.1f}{rep_suffix}"
 
             if mod == "off":
                 stim_arg = ""
             else:
                 stim_arg = f"-stim poisson -mod {mod} -stim_rate {stim_rate:.1f} "
 
-            f_dyn.write(
+            lines.append(
                 # dynamic command
                 f"python ./src/quadratic_integrate_and_fire.py "
-                + f'-o {dyn_path} '
-                + f"-k {k_inter} "
-                + f"-kin {k_in} "
-                + f"-d 1800 -equil 300 -s {seed:d} "
-                + f"--bridge_weight {bridge_weight} "
-                + f"--inhibition {inh_frac} "
-                + f"-jA {jA} -jG {jG} -jM {jM} -r {rate} -tD {tD} "
+                + f"-o {dyn_path} "
+                + cmd_args
                 + f"{stim_arg}\n"
             )
 
-            count_dynamic += 1
+        f_dyn.writelines(lines)
+        count_dynamic += len(lines)
 
 print(f"number of argument combinations for dynamics: {count_dynamic}")
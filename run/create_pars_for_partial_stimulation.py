@@ -15,6 +15,7 @@
 
 import os
 import numpy as np
+import pandas as pd
 from itertools import product
 
 # set directory to the location of this script file to use relative paths
@@ -52,48 +53,75 @@ print("l_stim_rate", l_stim_rate)
 bridge_weight = 1.0
 inh_frac = 0.20
 
-arg_list = list(product(l_k_inter, l_jA, l_jG, l_jM, l_tD, l_stim_rate))
+# one row per realization. same seed for everything with the same rep number,
+# product varies the last element fastest, as nested loops would.
+df = pd.DataFrame(
+    list(product(np.arange(len(l_rep)), l_k_inter, l_jA, l_jG, l_jM, l_tD, l_stim_rate)),
+    columns=["rep_idx", "k_inter", "jA", "jG", "jM", "tD", "stim_rate"],
+)
+df["rep"] = np.asarray(l_rep)[df["rep_idx"]]
+df["seed"] = seed + 1 + df["rep_idx"]
+mod = l_mod[0]
 
-count_dynamic = 0
-count_topo = 0
-with open("./parameters.tsv", "w") as f_dyn:
-    # set the cli arguments
-    f_dyn.write("# commands to run, one line per realization\n")
-
-    # same seed for everything with the same rep number.
-    for rep in l_rep:
-        seed += 1
+# format every column once, then assemble the lines column-wise
+fmt = lambda col, spec: df[col].map(spec.format)
+str_k_inter = df["k_inter"].astype(str)
+str_stim_rate = fmt("stim_rate", "{:.1f}")
 
-        for args in arg_list:
-            k_inter = args[0]
-            jA = args[1]
-            jG = args[2]
-            jM = args[3]
-            tD = args[4]
-            stim_rate = args[5]
-            mod = l_mod[0]
+dyn_path = (
+    f"{out_path}/stim={mod}_k="
+    + fmt("k_inter", "{:d}")
+    + f"_kin={k_in:d}_jA="
+    + fmt("jA", "{:.1f}")
+    + "_jG="
+    + fmt("jG", "{:.1f}")
+    + "_jM="
+    + fmt("jM", "{:.1f}")
+    + "_tD="
+    + fmt("tD", "{:.1f}")
+    + f"_rate={rate:.1f}_stimrate="
+    + str_stim_rate
+    + "_rep="
+    + fmt("rep", "{:03d}")
+    + ".hdf5"
+)
 
-            f_base = f"k={k_inter:d}_kin={k_in:d}_jA={jA:.1f}_jG={jG:.1f}_jM={jM:.1f}_tD={tD:.1f}_rate={rate:.1f}_stimrate={stim_rate:.1f}_rep={rep:03d}.hdf5"
-            dyn_path = f"{out_path}/stim={mod}_{f_base}"
+if mod == "off":
+    stim_arg = ""
+else:
+    stim_arg = f"-stim poisson -mod {mod} -stim_rate " + str_stim_rate + " "
 
-            if mod == "off":
-                stim_arg = ""
-            else:
-                stim_arg = f"-stim poisson -mod {mod} -stim_rate {stim_rate:.1f} "
+df["line"] = (
+    # dynamic command
+    "python ./src/quadratic_integrate_and_fire.py "
+    + "-o "
+    + dyn_path
+    + " -k "
+    + str_k_inter
+    + f" -kin {k_in} "
+    + "-d 1800 -equil 300 -s "
+    + fmt("seed", "{:d}")
+    + f" --bridge_weight {bridge_weight} "
+    + f"--inhibition {inh_frac} "
+    + "-jA "
+    + df["jA"].astype(str)
+    + " -jG "
+    + df["jG"].astype(str)
+    + " -jM "
+    + df["jM"].astype(str)
+    + f" -r {rate} -tD "
+    + df["tD"].astype(str)
+    + " "
+    + stim_arg
+    + "\n"
+)
 
-            f_dyn.write(
-                # dynamic command
-                f"python ./src/quadratic_integrate_and_fire.py "
-                + f'-o {dyn_path} '
-                + f"-k {k_inter} "
-                + f"-kin {k_in} "
-                + f"-d 1800 -equil 300 -s {seed:d} "
-                + f"--bridge_weight {bridge_weight} "
-                + f"--inhibition {inh_frac} "
-                + f"-jA {jA} -jG {jG} -jM {jM} -r {rate} -tD {tD} "
-                + f"{stim_arg}\n"
-            )
+# large buffer, we write many short lines
+with open("./parameters.tsv", "w", buffering=1 << 20) as f_dyn:
+    # set the cli arguments
+    f_dyn.write("# commands to run, one line per realization\n")
+    f_dyn.writelines(df["line"])
 
-            count_dynamic += 1
+count_dynamic = len(df)
 
 print(f"number of argument combinations for dynamics: {count_dynamic}")
@@ -11,10 +11,22 @@ import sys
 sys.path.append(f"{os.path.dirname(os.path.realpath(__file__))}/../src/")
 import mesoscopic_model as mm
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def _num_available_cpus():
+    # only the cores this process may use, e.g. when limited by taskset or slurm
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # not available on macos
+        return os.cpu_count()
 
 
 rng_start_seed = 42
 n_trajectories = 25  # number of repetitons per parameter combination
+# simulations to run in parallel, set MESO_NUM_WORKERS to override
+num_workers = int(os.environ.get("MESO_NUM_WORKERS", _num_available_cpus()))
 
 simulation_time = 1_000
 gating_mechanism = True
@@ -35,9 +47,12 @@ def main():
     """
     print(f"Gating mechanism is {'on' if gating_mechanism else 'off'}")
     print(f"Saving to {output_folder}")
+
+    # collect all simulations first, they are independent and run in parallel
+    jobs = []
     # iterate over repetitions last so we can explore all phase space while waiting
-    for rep in tqdm(range(n_trajectories), desc="repetitions", leave=True):
-        for c in tqdm(coupling_span, desc="coupling", leave=False):
+    for rep in range(n_trajectories):
+        for c in coupling_span:
             # one folder for every coupling
             coupling_folder = f"{output_folder}/coup{c:0.3f}-{rep:d}"
             # yes, the .2f precision turned out to be insufficient for the cpl values
@@ -45,29 +60,46 @@ def main():
             os.makedirs(coupling_folder, exist_ok=True)
 
             # Loop over different external inputs,
-            for j, h in tqdm(
-                enumerate(external_inputs),
-                total=len(external_inputs),
-                desc="noise",
-                leave=False,
-            ):
-                mm.simulate_and_save(
-                    output_filename=f"{coupling_folder}/noise_{h:0.3f}",
-                    simulation_time=simulation_time,
-                    # ext_str=h, # global stimulation
-                    ext_str=[h, 0.0, h, 0.0],  # partial stimulation
-                    w0=c,
-                    rseed=rng_start_seed + rep * 41533,
-                    gating_mechanism=gating_mechanism,
-                    meta_data=dict(
-                        coupling=c,
-                        noise=h,
-                        rep=rep,
+            for j, h in enumerate(external_inputs):
+                jobs.append(
+                    dict(
+                        output_filename=f"{coupling_folder}/noise_{h:0.3f}",
+                        simulation_time=simulation_time,
+                        # ext_str=h, # global stimulation
+                        ext_str=[h, 0.0, h, 0.0],  # partial stimulation
+                        w0=c,
+                        rseed=rng_start_seed + rep * 41533,
                         gating_mechanism=gating_mechanism,
-                        seed=rng_start_seed + rep * 41533,
-                    ),
+                        meta_data=dict(
+                            coupling=c,
+                            noise=h,
+                            rep=rep,
+                            gating_mechanism=gating_mechanism,
+                            seed=rng_start_seed + rep * 41533,
+                        ),
+                    )
                 )
 
+    # compile the integrator once, before the workers start. the compiled code
+    # is written to numba's on-disk cache (and inherited by forked workers), so
+    # workers do not compile in parallel. on clusters, point NUMBA_CACHE_DIR to
+    # a node-local directory.
+    mm.simulate_model(
+        simulation_time=1.0,
+        ext_str=[0.0, 0.0, 0.0, 0.0],
+        w0=0.0,
+        gating_mechanism=gating_mechanism,
+    )
+
+    # jobs are started in the order they were added
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(mm.simulate_and_save, **job) for job in jobs]
+        for future in tqdm(
+            as_completed(futures), total=len(futures), desc="simulations"
+        ):
+            # raise exceptions from the workers
+            future.result()
+
 
 if __name__ == "__main__":
     main()
@@ -17,6 +17,9 @@ log = logging.getLogger(__name__)
 log.setLevel("WARNING")
 warnings.filterwarnings("ignore")  # suppress numpy warnings
 
+GATE_CONNECTED = 1  # allow transmission
+GATE_DISCONNECTED = 0  # nothing goes through
+
 try:
     from numba import jit, prange
 
@@ -159,14 +162,19 @@ def simulate_model(simulation_time, **kwargs):
     if len(pars["ext_str"]) == 1:
         pars["ext_str"] = pars["ext_str"] * np.ones(4)
     elif len(pars["ext_str"]) == 4:
-        pass
+        # lists would be reflected by numba on every call, and compile their
+        # own version of the integrator
+        pars["ext_str"] = np.asarray(pars["ext_str"], dtype="float")
     else:
         raise ValueError("ext_str must be a float or a vector of length 4")
     log.debug(f"ext_str: {pars['ext_str']}")
-    return _simulate_model(simulation_time, **pars)
+    time_axis, rate, rsrc, gate_history = _simulate_model(simulation_time, **pars)
+
+    # the integrator keeps time on the first axis, our convention is time last.
+    # (these are views, no copies)
+    return time_axis, rate.T, rsrc.T, gate_history.transpose(1, 2, 0)
 
 
-@jit(nopython=True, parallel=False, fastmath=False, cache=True)
 def _simulate_model(
     simulation_time,
     gating_mechanism,
@@ -191,12 +199,17 @@ def _simulate_model(
 ):
     """
     This guy is wrapped, so we can set default arguments via the dictionary.
-    Numba does not like this.
+
+    Sets up the state and draws all random numbers with numpy's `default_rng`
+    (PCG64), in blocks of time steps. The time loop of each block is compiled,
+    see `_integrate_block`. (numba cannot use numpy Generators in nopython mode,
+    so the random numbers are passed in.)
+
+    Time series are returned with time as the first axis, (nt, 4) and (nt, 4, 4).
     """
 
     # Set random seed
-    if rseed != None:
-        np.random.seed(rseed)
+    rng = np.random.default_rng(rseed)
 
     thermalization_time = simulation_time * 0.1
     simulation_time = simulation_time + thermalization_time
@@ -204,25 +217,26 @@ def _simulate_model(
     # Binnings associated to such a time
     nt = int(simulation_time / dt)
 
-    GATE_CONNECTED = 1  # allow transmission
-    GATE_DISCONNECTED = 0  # nothing goes through
-
-    # time series of variables
+    # time series of variables, time is the first (slow) axis so that all
+    # modules of one time step are next to each other in memory.
     # activity (firing rate), init to random
-    rate = np.ones(shape=(4, nt), dtype="float") * np.nan
-    rate[:, 0] = np.random.rand(4)
+    rate = np.ones(shape=(nt, 4), dtype="float") * np.nan
+    rate[0, :] = rng.random(4)
     # resources
-    rsrc = np.ones(shape=(4, nt), dtype="float") * np.nan
-    rsrc[:, 0] = np.random.rand(4) * max_rsrc
+    rsrc = np.ones(shape=(nt, 4), dtype="float") * np.nan
+    rsrc[0, :] = rng.random(4) * max_rsrc
 
     # state of each gate at this time (directed) gate[from, to]
-    gate = np.ones(shape=(4, 4), dtype="int") * GATE_CONNECTED
+    # as bytes, the 16 gates fit into two machine words. every gate is only read
+    # and written by its own update, so we update in place, no copy needed.
+    gate = np.full((4, 4), GATE_CONNECTED, dtype=np.int8)
 
     # keep track of geates. lets keep the shape simple and set all non-existing gates to zero.
-    gate_history = np.zeros(shape=(4, 4, nt), dtype="int")
+    # gates are 0 or 1, one byte each is enough.
+    gate_history = np.zeros(shape=(nt, 4, 4), dtype=np.int8)
 
     # Coupling matrix
-    Aij = np.zeros(shape=(4, 4), dtype="int")  # Adjacency matrix
+    Aij = np.zeros(shape=(4, 4), dtype=np.int8)  # Adjacency matrix
     Aij[0, 1] = 1
     Aij[1, 0] = 1
     Aij[0, 2] = 1
@@ -232,99 +246,189 @@ def _simulate_model(
     Aij[2, 3] = 1
     Aij[3, 2] = 1
 
-    # Auxiliary shortcut to pre-compute this constant
-    # which is used in sigmoid transfer function
-    aux_thrsig = np.exp(k_inpt * thrs_inpt)
+    # existing gates as a list of [from, to], sorted by source. only those
+    # transmit input and get updated.
+    edges = np.argwhere(Aij == 1)
 
     # -------------
     # Simulation
     # -------------
 
+    # random numbers are drawn in blocks of time steps, one call per block
+    # instead of one call per module and gate in every step.
+    block_size = min(nt, 4096)
+    for t_start in range(0, nt - 1, block_size):
+        t_stop = min(t_start + block_size, nt - 1)
+        noise_rate = rng.standard_normal(size=(t_stop - t_start, 4))
+        noise_gate = rng.random(size=(t_stop - t_start, len(edges)))
+
+        _integrate_block(
+            t_start,
+            t_stop,
+            rate,
+            rsrc,
+            gate,
+            gate_history,
+            edges,
+            noise_rate,
+            noise_gate,
+            gating_mechanism,
+            max_rsrc,
+            tau_charge,
+            tau_discharge,
+            tau_rate,
+            sigma,
+            w0,
+            tau_disconnect,
+            tau_connect,
+            ext_str,
+            k_inpt,
+            thrs_inpt,
+            gain_inpt,
+            thrs_gate,
+            k_gate,
+            dt,
+        )
+
+    # this is a bit hacky...
+    # to thermalize, simply chop off the indices that correspond to thermalization time
+    rec_start = int(thermalization_time / dt)
+    rate = rate[rec_start:, :]
+    rsrc = rsrc[rec_start:, :]
+    gate_history = gate_history[rec_start:, :, :]
+
+    time_axis = np.arange(0, nt - rec_start) * dt
+    return time_axis, rate, rsrc, gate_history
+
+
+@jit(nopython=True, parallel=False, fastmath=False, cache=True)
+def _integrate_block(
+    t_start,
+    t_stop,
+    rate,
+    rsrc,
+    gate,
+    gate_history,
+    edges,
+    noise_rate,
+    noise_gate,
+    gating_mechanism,
+    max_rsrc,
+    tau_charge,
+    tau_discharge,
+    tau_rate,
+    sigma,
+    w0,
+    tau_disconnect,
+    tau_connect,
+    ext_str,
+    k_inpt,
+    thrs_inpt,
+    gain_inpt,
+    thrs_gate,
+    k_gate,
+    dt,
+):
+    """
+    Integrate the time steps `t_start` to `t_stop` (exclusive), in place.
+    `rate`, `rsrc` and `gate_history` have time as the first axis, `gate` holds
+    the current gate states and is updated. The noise arrays have one row per
+    time step of the block.
+    """
+
+    # Auxiliary shortcut to pre-compute this constant
+    # which is used in sigmoid transfer function
+    aux_thrsig = np.exp(k_inpt * thrs_inpt)
+
+    # probability of a closed gate to reconnect in one time step, constant
+    prob_connect = 1.0 - np.exp(-dt / tau_connect)
+
+    # probability to disconnect only depends on the source, compute once per step
+    prob_disconnect = np.zeros(4)
+
+    num_edges = len(edges)
+    noise_amp = np.sqrt(dt) * sigma
+
+    # constant factors of the updates, saves the divisions in every step
+    dt_over_tau_rate = dt / tau_rate
+    dt_over_tau_charge = dt / tau_charge
+    dt_over_tau_discharge = dt / tau_discharge
+    dt_charge = dt * max_rsrc / tau_charge
+
+    # input from neighbouring modules, reused every step
+    module_input = np.zeros(4)
+    drive = np.zeros(4)
+
     # Main computation loop: Milstein algorithm, assuming Ito interpretation
-    for t in range(nt - 1):
+    for t in range(t_start, t_stop):
+        bdx = t - t_start
 
-        # Update each module, `src` -> source module, `tar` -> target module
+        # Collect the part of input that arrives from other modules,
+        # `src` -> source module, `tar` -> target module.
+        # Only through existing gates, and the gate state (0 or 1) masks closed
+        # ones, instead of a branch.
+        for src in range(4):
+            drive[src] = w0 * rate[t, src] * rsrc[t, src]
+        module_input[:] = 0.0
+        for edx in range(num_edges):
+            src = edges[edx, 0]
+            tar = edges[edx, 1]
+            module_input[tar] += drive[src] * gate[src, tar]
+
+        # this should not happen.
+        # @victor, can you confirm, that we do not need this?
+        # module_input *= 0.5
+
+        # Update all modules in one go, Milstein algorithm:
+        # spontaneous decay of the firing rate to zero, input from all sources
+        # (recurrent, neighbours, external) and additive noise.
+        # @victor: noise only gets added with sqrt dt?
+        # resources are easier
         for tar in range(4):
-            # Collect the part of input that arrives from other modules
-            module_input = 0.0
-            for src in range(4):
-                # connection matrix. [from, to]. ajj is 0.
-                if Aij[src, tar] == 1:
-                    # Sum input to module tar, only through open gates
-                    if gate[src, tar] == GATE_CONNECTED:
-                        module_input += w0 * rate[src, t] * rsrc[src, t]
-
-            # this should not happen.
-            # @victor, can you confirm, that we do not need this?
-            # module_input *= 0.5
-
-            # Collect pieces to update our firing rate, Milstein algorithm
-            # Spontaneous decay, firing rate to zero
-            term1 = dt * (-rate[tar, t] / tau_rate)
-
-            # Input from all sources, recurrent, neighbours, external
-            total_input = rsrc[tar, t] * rate[tar, t] + module_input + ext_str[tar]
-
-            term2 = dt * transfer_function(
-                total_input,
-                gain_inpt,
-                k_inpt,
-                thrs_inpt,
-                aux_thrsig,
+            r_t = rate[t, tar]
+            s_t = rsrc[t, tar]
+            total_input = s_t * r_t + module_input[tar] + ext_str[tar]
+            feedback = transfer_function(
+                total_input, gain_inpt, k_inpt, thrs_inpt, aux_thrsig
+            )
+            rate[t + 1, tar] = (
+                r_t
+                - dt_over_tau_rate * r_t
+                + dt * feedback
+                + noise_amp * noise_rate[bdx, tar]
+            )
+            rsrc[t + 1, tar] = (
+                s_t
+                + dt_charge
+                - s_t * (dt_over_tau_charge + r_t * dt_over_tau_discharge)
             )
 
-            # additive noise
-            # @victor: noise only gets added with sqrt dt?
-            term3 = np.sqrt(dt) * np.random.standard_normal() * sigma
-
-            rate[tar, t + 1] = rate[tar, t] + term1 + term2 + term3
+        # Store gate history for export, before updating [from, to, time]
+        # we keep non-existing gates in the history, this helps debugging
+        gate_history[t, :, :] = gate
 
-            # resources are easier
-            rsrc[tar, t + 1] = rsrc[tar, t] + dt * (
-                -(rate[tar, t] * rsrc[tar, t]) / tau_discharge
-                + (max_rsrc - rsrc[tar, t]) / tau_charge
-            )
+        # update outgoing(!) gates for next time step, but only if the mechanism
+        # is enabled
+        if not gating_mechanism:
+            continue
 
-        # update gates for next time step
-        old_gate = gate.copy()
         for src in range(4):
-            for tar in range(4):
-                # Store gate history for export, before updating [from, to, time]
-                gate_history[src, tar, t] = gate[src, tar]
-                gate_history[src, tar, t] = gate[src, tar]
-
-                # update outgoing(!) gates, but only if the mechanism is enabled
-                if not gating_mechanism:
-                    continue
-
-                # dont touch non-existing gate
-                # we could skip before saving the gate history, but this helps debugging
-                if Aij[src, tar] == 0:
-                    continue
-
-                # Disconnect gate depending on activity of source
-                if old_gate[src, tar] == GATE_CONNECTED:
-                    prob = _probability_to_disconnect(
-                        rsrc[src, t], dt, thrs_gate, k_gate, tau_disconnect
-                    )
-                    if np.random.rand() < prob:
-                        gate[src, tar] = GATE_DISCONNECTED
-
-                # Connect gate with a characteristic time
-                else:
-                    prob = 1.0 - np.exp(-dt / tau_connect)
-                    if np.random.rand() < prob:
-                        gate[src, tar] = GATE_CONNECTED
+            prob_disconnect[src] = _probability_to_disconnect(
+                rsrc[t, src], dt, thrs_gate, k_gate, tau_disconnect
+            )
 
-    # this is a bit hacky...
-    # to thermalize, simply chop off the indices that correspond to thermalization time
-    rec_start = int(thermalization_time / dt)
-    rate = rate[:, rec_start:]
-    rsrc = rsrc[:, rec_start:]
-    gate_history = gate_history[:, :, rec_start:]
+        # dont touch non-existing gates
+        for edx in range(num_edges):
+            src = edges[edx, 0]
+            tar = edges[edx, 1]
 
-    time_axis = np.arange(0, nt - rec_start) * dt
-    return time_axis, rate, rsrc, gate_history
+            # Disconnect gate depending on activity of source,
+            # Connect gate with a characteristic time.
+            # written without branches: select the probability to switch, and
+            # flip the gate state (0 <-> 1) if the random number is below.
+            connected = gate[src, tar] == GATE_CONNECTED
+            prob_flip = prob_disconnect[src] if connected else prob_connect
+            gate[src, tar] ^= noise_gate[bdx, edx] < prob_flip
 
 
 def probability_to_disconnect(resources, **kwargs):
@@ -332,7 +436,7 @@ def probability_to_disconnect(resources, **kwargs):
     Returns the probability of the gate to be closed depending on sigmoid response and currently available resources
 
     #Parameters:
-    resources : float
+    resources : float, or array of floats
         Level of resources
     dt : float
         Integration timestep
@@ -344,7 +448,7 @@ def probability_to_disconnect(resources, **kwargs):
         Time scale at which the gate disconnects when no resources are available
 
     # Returns
-    prob_close: float
+    prob_close: float, or array of floats
         Probability of gate closing for the currently available number of resources.
     """
     pars = default_pars.copy()
@@ -505,11 +609,13 @@ def simulate_and_save(output_filename, meta_data=None, **kwargs):
     os.makedirs(os.path.dirname(output_filename), exist_ok=True)
 
     # Create a DataFrame easy to read in our workflow and export as HDF
-    df = pd.DataFrame(columns=["time"] + [f"mod_{m_cd}" for m_cd in range(1, 5)])
-    df["time"] = time
+    # build it in one go from a dict, instead of growing it column by column
+    columns = dict(time=time)
+    for m_cd in range(4):
+        columns[f"mod_{m_cd+1}"] = activity[m_cd, :]
     for m_cd in range(4):
-        df[f"mod_{m_cd+1}"] = activity[m_cd, :]
-        df[f"mod_{m_cd+1}_res"] = resources[m_cd, :]
+        columns[f"mod_{m_cd+1}_res"] = resources[m_cd, :]
+    df = pd.DataFrame(columns)
 
     # For the first module, store also the dynamics of its gate
     # for gateind in range(2):
@@ -521,19 +627,19 @@ def simulate_and_save(output_filename, meta_data=None, **kwargs):
 
     if os.path.exists(f"{output_filename}"):
         os.remove(f"{output_filename}")
-    df.to_hdf(f"{output_filename}", f"/dataframe", complevel=9)
+    # blosc:lz4 is much faster than zlib at level 9, with similar file size for
+    # smooth traces. the filter ships with pytables, reading is unchanged.
+    df.to_hdf(f"{output_filename}", key="/dataframe", complib="blosc:lz4", complevel=5)
 
     # This is quite inconsistent, most data is saved with pandas, only this is
     # native hdf5. fixing requires a rewrite of meso_helper
-    file = h5py.File(f"{output_filename}", "r+")
-    file.create_dataset(f"/data/gate_history", data=gate_history, compression="gzip")
-    file.close()
-
-    if meta_data is not None:
-        file = h5py.File(f"{output_filename}", "r+")
-        for key in meta_data.keys():
-            try:
-                file.create_dataset(f"/meta/{key}", data=meta_data[key])
-            except Exception as e:
-                log.exception(e)
-        file.close()
+    with h5py.File(f"{output_filename}", "r+") as file:
+        # lzf is built into h5py, fast and good enough for the mostly constant gates
+        file.create_dataset(f"/data/gate_history", data=gate_history, compression="lzf")
+
+        if meta_data is not None:
+            for key in meta_data.keys():
+                try:
+                    file.create_dataset(f"/meta/{key}", data=meta_data[key])
+                except Exception as e:
+                    log.exception(e)
@@ -109,7 +109,6 @@ record_state = True
 record_state_vars = ["D"]
 # for which neurons, True for everything, or list of indices
 record_state_idxs = True # [0, 1, 2, 3]
-record_state_idxs = np.arange(0, 160)
 
 # save state variables in steps of 25ms (the default) to save disk space
 # use 0.5 for the highres simulations needed for nice rate-resource cycles
@@ -245,6 +244,34 @@ parser.add_argument(
     help="fraction of neurons that should be inhibitory",
 )
 
+parser.add_argument(
+    "--device",
+    dest="device",
+    default="cpp_standalone",
+    metavar="cpp_standalone",
+    type=str,
+    choices=["runtime", "cpp_standalone", "cuda_standalone"],
+    help=(
+        "brian device. 'cpp_standalone' compiles the whole simulation into one c++"
+        " program, 'runtime' uses cython code generation with python in the loop."
+        " 'cuda_standalone' runs on the gpu, needs brian2cuda and only pays off for"
+        " large networks (> 1k neurons)"
+    ),
+)
+
+parser.add_argument(
+    "--threads",
+    dest="num_threads",
+    default=0,
+    metavar=0,
+    type=int,
+    help=(
+        "number of openmp threads for the 'cpp_standalone' device. 0 (default)"
+        " runs single threaded without openmp. with threads, random numbers are"
+        " drawn per thread, so results depend on the number of threads"
+    ),
+)
+
 parser.add_argument(
     "--record-state-dt",
     dest="record_state_dt",
@@ -257,11 +284,39 @@ parser.add_argument(
     ),
 )
 
+parser.add_argument(
+    "--record-state-neurons",
+    dest="record_state_neurons",
+    default="all",
+    metavar="all",
+    type=str,
+    help=(
+        "which neurons to record state variables for. 'all', 'none', or a comma"
+        " separated list of neuron ids, e.g. `0,12`. state monitors hold"
+        " num_neurons x num_timesteps values in ram, only record what you need"
+    ),
+)
+
 args = parser.parse_args()
 
+# standalone mode has to be set before any brian objects are created.
+# every process gets its own build directory, so we can run many on a cluster.
+build_dir = f"{tempfile.gettempdir()}/brian_standalone/pid-{os.getpid()}"
+if args.device == "cpp_standalone":
+    set_device("cpp_standalone", directory=build_dir, build_on_run=False)
+    prefs.devices.cpp_standalone.openmp_threads = args.num_threads
+elif args.device == "cuda_standalone":
+    import brian2cuda
+
+    prefs.devices.cuda_standalone.cuda_backend.gpu_id = 0
+    set_device("cuda_standalone", directory=build_dir, build_on_run=False)
+
 # RNG
 numpy.random.seed(args.seed)
 topo.set_seed(args.seed)
+if args.device != "runtime":
+    # the generated code has its own rng, which does not know about numpy
+    seed(args.seed)
 
 # correct units
 jA = args.jA * mV
@@ -278,6 +333,8 @@ args.stimulation_rate *= Hz
 print(f'#{"":#^75}#\n#{"running dynamics in brian":^75}#\n#{"":#^75}#')
 log.info("output path:      %s", args.output_path)
 log.info("seed:             %s", args.seed)
+log.info("device:           %s", args.device)
+log.info("threads:          %s", args.num_threads)
 log.info("k_inter:          %s", args.k_inter)
 log.info("k_in:             %s", args.k_in)
 log.info("jA:               %s", jA)
@@ -287,8 +344,7 @@ log.info("tD:               %s", tD)
 log.info("noise rate:       %s", rate)
 log.info("duration:         %s", args.sim_duration)
 log.info("equilibration:    %s", args.equil_duration)
-log.info("recording states: %s", record_state)
-log.info("  with time step: %s", record_state_dt)
+log.info("state time step:  %s", record_state_dt)
 log.info("recording rates:  %s", record_rates)
 log.info("bridge weight:    %s", args.bridge_weight)
 log.info("inhibition:       %s (fraction of all neurons)", args.inhibition_fraction)
@@ -322,6 +378,24 @@ num_n = tp.par_N
 a_ij_sparse = tp.aij_sparse
 mod_ids = tp.neuron_module_ids
 
+# neurons for which to record state variables, in topology indices
+if args.record_state_neurons == "none":
+    record_state = False
+elif args.record_state_neurons == "all":
+    record_state_idxs = True
+else:
+    record_state_idxs = np.array(
+        [int(i) for i in args.record_state_neurons.split(",")], dtype="int64"
+    )
+    if np.any(record_state_idxs < 0) or np.any(record_state_idxs >= num_n):
+        raise ValueError(
+            f"--record-state-neurons needs ids in [0, {num_n}), got"
+            f" {args.record_state_neurons}"
+        )
+log.info("recording states: %s", record_state)
+if record_state:
+    log.info("  for neurons:    %s", args.record_state_neurons)
+
 
 # ------------------------------------------------------------------------------ #
 # model, neurons
@@ -382,13 +456,9 @@ G.j = 0  # the lines below should overwrite this, sanity check
 G_inh.j = jG
 G_exc.j = jA
 if len(bridge_ids) > 0:
-    G_bridge.j *= args.bridge_weight
-
-if not np.all(G.j != 0):
-    log.warning(
-        "Some synapse strenght `j` were zero after initialization. This should only"
-        " happen if you manually set some `j` to zero!"
-    )
+    # string expression instead of `*=`, in standalone mode we cannot read values
+    # before the simulation ran
+    G_bridge.j = f"j * {args.bridge_weight}"
 
 
 # ------------------------------------------------------------------------------ #
@@ -417,35 +487,37 @@ log.info("Applying connectivity from sparse matrix")
 # and the different index conventions
 # S.connect(i=a_ij_sparse[:, 0], j=a_ij_sparse[:, 1])
 
-for n_id in inhib_ids:
-    # i goes from 0 to num_inhib, and is already in brian index convention
-    i = np.where(inhib_ids == n_id)[0][0]
-    idx = np.where(a_ij_sparse[:, 0] == n_id)[0]
+def connect_from_subgroup(syn, sub_ids):
+    # position of each topology index in the subgroup, -1 if not part of it.
+    # i goes from 0 to len(sub_ids), and is already in brian index convention
+    sub_pos = np.full(num_n, -1, dtype="int64")
+    sub_pos[sub_ids] = np.arange(len(sub_ids))
+    ii = sub_pos[a_ij_sparse[:, 0].astype("int64")]
+    idx = np.where(ii >= 0)[0]
+    # stable sort keeps the synapse order of connecting neuron by neuron
+    idx = idx[np.argsort(ii[idx], kind="stable")]
     if len(idx) == 0:
-        continue
-    ii = i * np.ones(len(idx), dtype="int64")
+        return
     # jj goes from 0 to num_n, and we still need to convert
-    jj = t2b[a_ij_sparse[idx, 1]]
-    S_inh.connect(i=ii, j=jj)
+    jj = t2b[a_ij_sparse[idx, 1].astype("int64")]
+    syn.connect(i=ii[idx], j=jj)
 
-for n_id in excit_ids:
-    i = np.where(excit_ids == n_id)[0][0]
-    idx = np.where(a_ij_sparse[:, 0] == n_id)[0]
-    if len(idx) == 0:
-        continue
-    ii = i * np.ones(len(idx), dtype="int64")
-    jj = t2b[a_ij_sparse[idx, 1]]
-    S_exc.connect(i=ii, j=jj)
+
+connect_from_subgroup(S_inh, inhib_ids)
+connect_from_subgroup(S_exc, excit_ids)
 
 # ------------------------------------------------------------------------------ #
 # Stimulation if requested
 # ------------------------------------------------------------------------------ #
 
 if args.stimulation_type == "poisson":
-    stim_ids = []
-    for mod in args.stimulation_module:
-        stim_ids.extend(np.where(mod_ids == mod)[0])
-    stim_ids = t2b[np.array(stim_ids)]
+    # the stimulus is drawn by brian during the run, so there is no pattern to
+    # precompute. we only need the targets, in the order of the given modules.
+    stim_ids = t2b[
+        np.concatenate(
+            [np.flatnonzero(mod_ids == mod) for mod in args.stimulation_module]
+        )
+    ]
 
     stim_g = PoissonGroup(len(stim_ids), args.stimulation_rate)
     stim_s = Synapses(stim_g, G, on_pre="IA_post += jM")
@@ -457,7 +529,8 @@ if args.stimulation_type == "poisson":
 # ------------------------------------------------------------------------------ #
 
 log.info("Equilibrating")
-run(args.equil_duration, report="stdout", report_period=60 * 60 * second)
+# no progress report for equilibration, the recording run reports for both
+run(args.equil_duration, report=None)
 
 # add monitors after equilibration
 spks_m = SpikeMonitor(G)
@@ -470,11 +543,21 @@ if record_state:
         rec = t2b[record_state_idxs]
     stat_m = StateMonitor(G, record_state_vars, record=rec, dt=record_state_dt)
 
-if record_rates:
-    rate_m = PopulationRateMonitor(G)
-
 log.info("Recording data")
-run(args.sim_duration, report="stdout", report_period=60 * second)
+# report_period is wall-clock time, so this stays cheap for long simulations.
+# in standalone mode the reporting is part of the generated code.
+run(args.sim_duration, report="text", report_period=5 * 60 * second)
+
+if args.device != "runtime":
+    # until here, runs were only collected. compile and run everything in one go
+    log.info("Building and running standalone code in %s", build_dir)
+    device.build(directory=build_dir, compile=True, run=True, debug=False)
+
+if not np.all(G.j != 0):
+    log.warning(
+        "Some synapse strenght `j` were zero after initialization. This should only"
+        " happen if you manually set some `j` to zero!"
+    )
 
 
 # ------------------------------------------------------------------------------ #
@@ -557,35 +640,47 @@ h5_desc["data.neuron_excitatory_ids"] = "List of neuron ids that were set to be
 # I save the spike times as a nan-padded 2d array with shape (num_neurons, max_num_spikes)
 # but also in what people might expect, a 2-col list (neuron_id, spike_time)
 def convert_brian_spikes_to_pauls(spks_m):
-    trains = spks_m.spike_trains()
-    num_n = len(trains)  # monitor may be defined on a subgroup
-    tmax = 0
-    for tdx in trains.keys():
-        if len(trains[tdx]) > tmax:
-            tmax = len(trains[tdx])
-    spiketimes = np.zeros(shape=(num_n, tmax))
-    spiketimes_as_list = np.zeros(shape=(2, spks_m.num_spikes))
-    last_idx = 0
-    for n in range(0, num_n):
-        # t = trains[n]
-        t = trains[t2b[n]]  # convert back from brian to topology indices
-        spiketimes[n, 0 : len(t)] = (t - args.equil_duration) / second
-        spiketimes_as_list[0, last_idx : last_idx + len(t)] = [n] * len(t)
-        spiketimes_as_list[1, last_idx : last_idx + len(t)] = (
-            t - args.equil_duration
-        ) / second
-        last_idx += len(t)
-    return spiketimes, spiketimes_as_list.T
+    num_n = len(spks_m.source)  # monitor may be defined on a subgroup
+
+    # convert back from brian to topology indices
+    idx = b2t[np.asarray(spks_m.i[:], dtype="int64")]
+    times = np.asarray((spks_m.t[:] - args.equil_duration) / second)
+
+    # spikes are recorded in time order, a stable sort by neuron keeps it
+    # within every neuron
+    order = np.argsort(idx, kind="stable")
+    idx = idx[order]
+    times = times[order]
+
+    # compressed sparse rows: spikes of neuron n are values[indptr[n]:indptr[n+1]]
+    counts = np.bincount(idx, minlength=num_n)
+    indptr = np.concatenate(([0], np.cumsum(counts)))
+
+    return indptr, times
+
+
+def spikes_csr_to_list(indptr, values):
+    # two-column list [neuron_id, spiketime], neuron ids as floats
+    neuron_ids = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    return np.column_stack((neuron_ids.astype("float"), values))
+
 
 try:
     # normal spikes, no stim, in two different formats
-    spks, spks_as_list = convert_brian_spikes_to_pauls(spks_m)
-
-    h5_data["data.spiketimes"] = spks
-    h5_desc["data.spiketimes"] = "2d array of spiketimes, neuron x spiketime in seconds, zero-padded"
+    spks_indptr, spks_values = convert_brian_spikes_to_pauls(spks_m)
+    spks_as_list = spikes_csr_to_list(spks_indptr, spks_values)
+
+    # a zero-padded 2d array would need as many columns as the most active neuron
+    # has spikes. instead, store ragged rows. there is no `data.spiketimes` in
+    # the file, `ana_helper.prepare_file` and `ana_helper.load_spiketimes`
+    # convert this to the (nan-padded) 2d array.
+    h5_data["data.spiketimes_indptr"] = spks_indptr
+    h5_desc["data.spiketimes_indptr"] = "row pointers of spiketimes, in compressed sparse row format. spiketimes of neuron n are `data.spiketimes_values[indptr[n]:indptr[n+1]]`"
+    h5_data["data.spiketimes_values"] = spks_values
+    h5_desc["data.spiketimes_values"] = "spiketimes in seconds, sorted by neuron and then time. see `data.spiketimes_indptr`"
 
     h5_data["data.spiketimes_as_list"] = spks_as_list
-    h5_desc["data.spiketimes_as_list"] = "two-column list of spiketimes. first col is neuron id, second col the spiketime. effectively same data as in 'data.spiketimes'. neuron id will need casting to int for indexing."
+    h5_desc["data.spiketimes_as_list"] = "two-column list of spiketimes. first col is neuron id, second col the spiketime. effectively same data as in 'data.spiketimes_values'. neuron id will need casting to int for indexing."
 
     if record_state:
         # write the time axis once for all variables and neurons (should be shared)
@@ -604,31 +699,34 @@ try:
                 # we already called t2b for the selection, no need again
                 data = stat_m.variables[var].get_value()[:, :]
 
-            h5_data[f"data.state_vars_{var}"] = data.T
+            # single precision is plenty for state variables, and halves the
+            # file size. (the transpose gets copied anyway, cast on the way)
+            h5_data[f"data.state_vars_{var}"] = np.ascontiguousarray(
+                data.T, dtype=np.float32
+            )
             h5_desc[f"data.state_vars_{var}"] = f"state variable {var}, dim 1 neurons, dim 2 value for time, recorded neurons: {record_state_idxs}"
 
 
     if record_rates:
         # we could write rates, but
         # at the default timestep, the data files (and RAM requirements) get huge.
-        # write with lower frequency, and smooth to not miss sudden changes
-        freq = int(record_rates_freq / defaultclock.dt)
-        width = record_rates_freq
-
-        def write_rate(mon, dsetname, description):
-            tmp = [
-                (mon.t / second - args.equil_duration / second)[::freq],
-                (mon.smooth_rate(window="gaussian", width=width) / Hz)[::freq],
-            ]
-            h5_data[dsetname] = np.array(tmp).T
-            h5_desc[dsetname] = description
-
-        # main rate monitor
-        write_rate(
-            rate_m,
-            "data.population_rate_smoothed",
-            "population rate in Hz, smoothed with gaussian kernel (of 50ms? width), first dim is time in seconds",
+        # instead of a PopulationRateMonitor at every time step, bin the spikes
+        # with the lower frequency, and smooth to not miss sudden changes.
+        # gaussian kernel with the bin size as width (std), cut at 4 std.
+        bin_size = record_rates_freq / second
+        num_bins = int(np.ceil(args.sim_duration / second / bin_size))
+        counts, _ = np.histogram(
+            spks_values, bins=num_bins, range=(0, num_bins * bin_size)
+        )
+        pop_rate = counts / (bin_size * len(G))
+        kernel = np.exp(-0.5 * np.arange(-4, 5) ** 2)
+        pop_rate = np.convolve(pop_rate, kernel / np.sum(kernel), mode="same")
+
+        # every value describes its bin, stamp it at the bin center
+        h5_data["data.population_rate_smoothed"] = np.column_stack(
+            ((np.arange(num_bins) + 0.5) * bin_size, pop_rate)
         )
+        h5_desc["data.population_rate_smoothed"] = f"population rate in Hz, binned and smoothed with gaussian kernel of {record_rates_freq / ms:.0f}ms width, first dim is time in seconds"
 
     if args.output_path is not None:
         print(f'#{"":#^75}#\n#{"Saving...":^75}#\n#{"":#^75}#')
@@ -642,8 +740,9 @@ try:
 except Exception as e:
     log.exception("Unable to save to disk")
 
-# remove cython caches
+# remove cython caches and standalone build files
 try:
     shutil.rmtree(cache_dir, ignore_errors=True)
+    shutil.rmtree(build_dir, ignore_errors=True)
 except Exception as e:
     log.exception("Unable to remove cached files")
@@ -1403,45 +1403,28 @@ def index_alignment(num_n, num_inhib, bridge_ids):
     inhib_ids_old = np.sort(np.random.choice(num_n, size=num_inhib, replace=False))
     bridge_ids_old = bridge_ids
 
-    inhib_no_bridge = []
-    inhib_bridge = []
-    excit_bridge = []
-    excit_no_bridge = []
-
-    for n_id in range(0, num_n):
-        if n_id in inhib_ids_old:
-            if n_id in bridge_ids_old:
-                inhib_bridge.append(n_id)
-            else:
-                inhib_no_bridge.append(n_id)
-        else:
-            if n_id in bridge_ids_old:
-                excit_bridge.append(n_id)
-            else:
-                excit_no_bridge.append(n_id)
+    # masks over all neurons, ids stay sorted within each group
+    n_ids = np.arange(0, num_n, dtype="int64")
+    is_inhib = np.isin(n_ids, inhib_ids_old)
+    is_bridge = np.isin(n_ids, bridge_ids_old)
 
     brian_indices = np.concatenate(
         [
-            np.sort(inhib_no_bridge),
-            np.sort(inhib_bridge),
-            np.sort(excit_bridge),
-            np.sort(excit_no_bridge),
+            n_ids[is_inhib & ~is_bridge],
+            n_ids[is_inhib & is_bridge],
+            n_ids[~is_inhib & is_bridge],
+            n_ids[~is_inhib & ~is_bridge],
         ]
-    ).astype("int64")
+    )
     assert len(brian_indices) == num_n
 
-    # inverse mapping and resorted inputs
+    # inverse mapping (of the permutation) and resorted inputs
     topo_indices = np.zeros(num_n, dtype="int64")
-    bridge_ids_new = []
-
-    for n_id in brian_indices:
-        topo_indices[n_id] = np.where(brian_indices == n_id)[0][0]
-        if n_id in bridge_ids_old:
-            bridge_ids_new.append(n_id)
+    topo_indices[brian_indices] = n_ids
 
     inhib_ids_new = brian_indices[0:num_inhib]
     excit_ids_new = brian_indices[num_inhib:]
-    bridge_ids_new = np.array(bridge_ids_new, dtype="int64")
+    bridge_ids_new = brian_indices[is_bridge[brian_indices]]
 
     return (
         topo_indices,
@@ -1505,17 +1488,34 @@ def _load_bridging_neurons(input_path):
         return []
 
 
-def _connect_synapses_from(S, a_ij):
+def _connect_synapses_from(S, a_ij, sparse=False):
     """
     Apply connectivity matrix to brian Synapses object `S`.
     Not used at the moment.
+
+    # Parameters
+    a_ij : the dense matrix of shape (num_n, num_n), or with `sparse=True`,
+        the sparse connectivity matrix, shape (num_connections, 2)
+        with [from_index, to_index].
+        Prefer the sparse one, the dense one is only scanned for entries equal to 1.
+    sparse : bool, whether `a_ij` is the sparse connectivity matrix.
+        Needs to be explicit, the shape alone is ambiguous (e.g. two edges).
     """
+    a_ij = np.asarray(a_ij)
+    if sparse and (a_ij.ndim != 2 or a_ij.shape[1] != 2):
+        raise ValueError(
+            f"sparse a_ij needs shape (num_connections, 2), not {a_ij.shape}"
+        )
+
     try:
-        log.info("Applying connectivity (non-sparse) ... ")
-        pre, post = np.where(a_ij == 1)
-        for idx, i in enumerate(pre):
-            j = post[idx]
-            S.connect(i=i, j=j)
+        if sparse:
+            log.info("Applying connectivity (sparse) ... ")
+            pre = a_ij[:, 0].astype("int64", copy=False)
+            post = a_ij[:, 1].astype("int64", copy=False)
+        else:
+            log.info("Applying connectivity (non-sparse) ... ")
+            pre, post = np.nonzero(a_ij == 1)
+        S.connect(i=pre, j=post)
     except Exception as e:
         log.error(e)
         log.info(f"Creating Synapses randomly.")